@@ -0,0 +1,232 @@
+import atexit
+import contextlib
+import logging
+import queue
+import sys
+import threading
+from collections import deque, namedtuple
+from time import monotonic, sleep
+
+BLINK_CYCLES = 6
+DEFAULT_QUEUE_SIZE = 256
+LATENCY_HISTORY = 1024
+
+Alert = namedtuple('Alert', ['message', 'enqueued_at'])
+
+_STOP = object()
+
+
+def _remaining(timeout, started):
+    """Return what is left of timeout seconds since started, or None."""
+    if timeout is None:
+        return None
+    return max(0.0, timeout - (monotonic() - started))
+
+
+def _blink(stream, pause):
+    """Alternate the asterisk frames on the current line."""
+    for _ in range(BLINK_CYCLES):
+        for frame in ('\r* ', '\r *'):
+            print(frame, end='', file=stream)
+            stream.flush()
+            sleep(pause)
+
+
+def blink_alert(message, stream=None, pause=1):
+    """Print message followed by the blinking asterisk animation."""
+    stream = stream or sys.stdout
+    print(message, file=stream)
+    _blink(stream, pause)
+
+
+class ConsoleSink:
+    """Show alerts on the console with the blinking animation."""
+
+    def __init__(self, stream=None, pause=1):
+        self.stream = stream
+        self.pause = pause
+
+    def deliver(self, alert):
+        blink_alert(alert.message, self.stream, self.pause)
+
+
+class LogSink:
+    """Write alerts to a standard library logger."""
+
+    def __init__(self, logger=None, level=logging.CRITICAL):
+        self.logger = logger or logging.getLogger('monitor.alerts')
+        self.level = level
+
+    def deliver(self, alert):
+        self.logger.log(self.level, alert.message)
+
+
+class MemorySink:
+    """Keep delivered alerts in a list, for tests and inspection."""
+
+    def __init__(self):
+        self.alerts = []
+
+    def deliver(self, alert):
+        self.alerts.append(alert)
+
+    @property
+    def messages(self):
+        return [alert.message for alert in self.alerts]
+
+
+class RateLimitedSink:
+    """Pass alerts on to a sink through a token bucket.
+
+    Up to burst alerts go through at once, refilled at rate per second;
+    alerts over the limit are dropped and counted in `suppressed`.
+    """
+
+    def __init__(self, sink, rate, burst=1, clock=monotonic):
+        self.sink = sink
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.suppressed = 0
+        self._clock = clock
+        self._refilled_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._refilled_at
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self._refilled_at = now
+
+    def deliver(self, alert):
+        self._refill()
+        if self.tokens < 1:
+            self.suppressed += 1
+            return
+        self.tokens -= 1
+        self.sink.deliver(alert)
+
+
+class _SinkWorker:
+    """Deliver alerts to one sink from its own queue and thread."""
+
+    def __init__(self, sink, maxsize, latencies):
+        self.sink = sink
+        self.latencies = latencies
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run, name='alert-dispatcher', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=None):
+        """Wait up to timeout seconds in all to queue the stop marker
+        and for the thread to finish; a thread whose queue stayed full
+        is left delivering."""
+        if self.thread is None:
+            return
+        started = monotonic()
+        with contextlib.suppress(queue.Full):
+            self.queue.put(_STOP, timeout=timeout)
+            self.thread.join(_remaining(timeout, started))
+            self.thread = None
+
+    def _deliver(self, alert):
+        try:
+            self.sink.deliver(alert)
+        except Exception:
+            logging.getLogger(__name__).exception('Alert sink failed')
+        self.latencies.append(monotonic() - alert.enqueued_at)
+
+    def _run(self):
+        for alert in iter(self.queue.get, _STOP):
+            self._deliver(alert)
+            self.queue.task_done()
+        self.queue.task_done()
+
+
+class AlertDispatcher:
+    """Deliver alerts to sinks from background threads, one per sink.
+
+    A slow sink, such as the blinking console, only delays its own
+    alerts. Submitting never blocks: when the bounded queue of a sink is
+    full the alert is counted in `dropped` and `submit` returns False.
+    latencies holds the seconds from submit until a sink finished.
+    """
+
+    def __init__(self, sinks, maxsize=DEFAULT_QUEUE_SIZE):
+        self.sinks = list(sinks)
+        self.dropped = 0
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self._lock = threading.Lock()
+        self._workers = [_SinkWorker(sink, maxsize, self.latencies)
+                         for sink in self.sinks]
+
+    def start(self):
+        """Start the delivery threads; returns the dispatcher for chaining."""
+        for worker in self._workers:
+            worker.start()
+        return self
+
+    def _offer(self, worker, alert):
+        try:
+            worker.queue.put_nowait(alert)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def submit(self, message):
+        """Queue message for every sink without waiting on any of them."""
+        alert = Alert(message, monotonic())
+        return all([self._offer(worker, alert) for worker in self._workers])
+
+    def flush(self):
+        """Block until every queued alert has been delivered."""
+        for worker in self._workers:
+            worker.queue.join()
+
+    def stop(self, timeout=None):
+        """Deliver what is queued, then stop the delivery threads.
+
+        timeout bounds the wait for each sink.
+        """
+        for worker in self._workers:
+            worker.stop(timeout)
+
+
+_default_dispatcher = None
+_default_lock = threading.Lock()
+
+
+def _create_default_dispatcher():
+    global _default_dispatcher
+    with _default_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = AlertDispatcher([ConsoleSink()]).start()
+        return _default_dispatcher
+
+
+def default_dispatcher():
+    """Return the shared console dispatcher, starting it on first use."""
+    return _default_dispatcher or _create_default_dispatcher()
+
+
+def set_default_dispatcher(dispatcher):
+    """Replace the shared dispatcher and return the previous one."""
+    global _default_dispatcher
+    with _default_lock:
+        previous, _default_dispatcher = _default_dispatcher, dispatcher
+    return previous
+
+
+@atexit.register
+def _stop_default_dispatcher():
+    """Deliver the alerts still queued on the shared dispatcher at exit,
+    so a short-lived process does not lose them with its daemon threads."""
+    dispatcher = _default_dispatcher
+    if dispatcher is not None:
+        dispatcher.stop()
@@ -0,0 +1,176 @@
+import math
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from engine import NO_STATUS
+from monitor import (BAND_STATUS, STATUS_CRITICAL, STATUS_OK,
+                     STATUS_WARNING_HIGH, STATUS_WARNING_LOW, VITAL_ALERTING,
+                     VITALS, threshold_profile)
+
+# How far a status is from ok; an unseen vital is below every status
+SEVERITY = {NO_STATUS: -1, STATUS_OK: 0, STATUS_WARNING_LOW: 1,
+            STATUS_WARNING_HIGH: 1, STATUS_CRITICAL: 2}
+
+# Band edges to leave a band by, and dwell seconds per STATUS_* code
+AlertRule = namedtuple('AlertRule', ['exit_edges', 'dwell'])
+
+
+def exit_edges(edges, hysteresis):
+    """Shift band edges toward the ok band by hysteresis.
+
+    Readings classified against the shifted edges only leave a band
+    once they are hysteresis past its edge; the shifted edges never
+    cross the middle of the ok band.
+    """
+    low_min, ok_min, high_min, high = edges
+    middle = (ok_min + high_min) / 2
+    low = (min(edge + hysteresis, middle) for edge in (low_min, ok_min))
+    high = (max(edge - hysteresis, middle) for edge in (high_min, high))
+    return (*low, *high)
+
+
+def compile_rule(edges, policy):
+    """Compile the VITAL_ALERTING policy of a vital for its band edges."""
+    dwell = policy.get('dwell_seconds', 0)
+    critical_dwell = policy.get('critical_dwell_seconds', 0)
+    return AlertRule(exit_edges(edges, policy.get('hysteresis', 0)),
+                     (dwell, dwell, dwell, critical_dwell))
+
+
+class _PendingAlerts:
+    """Status waiting out its dwell time, and since when, per vital."""
+    __slots__ = ('status', 'since')
+
+    def __init__(self, vitals):
+        self.status = bytearray([NO_STATUS]) * vitals
+        self.since = array('d', bytes(8 * vitals))
+
+    def grow(self, vitals):
+        """Make room for vitals registered after these were created."""
+        added = vitals - len(self.status)
+        self.status.extend(bytes([NO_STATUS]) * added)
+        self.since.extend([0.0] * added)
+
+
+class AlertTracker:
+    """Settle raw statuses into reported ones, suppressing flapping.
+
+    Escalations are taken at the band edges, but a reading only moves
+    toward ok once it is past an edge by the vital's hysteresis, and
+    any change is reported only after holding for its dwell time. Pass
+    to MonitorEngine(alerts=...) to filter its transitions; state is a
+    fixed few bytes per patient and vital.
+    """
+
+    def __init__(self, policy=None):
+        self.policy = VITAL_ALERTING if policy is None else policy
+        # The registry's vital ids, shared so later registrations show up
+        self.vital_index = VITALS.ids
+        self._patients = {}
+        self._restored_status = {}
+        self._restored_since = {}
+        self._rules = {}
+        self._profile = None
+
+    def __len__(self):
+        return len(self._patients) + len(self._restored_status)
+
+    def _pending_of(self, patient_id):
+        pending = self._patients.get(patient_id)
+        if pending is None:
+            pending = _PendingAlerts(len(self.vital_index))
+            status = self._restored_status.pop(patient_id, None)
+            if status is not None:
+                pending.status[:] = status
+                pending.since[:] = array(
+                    'd', self._restored_since.pop(patient_id))
+            self._patients[patient_id] = pending
+        return pending
+
+    def _rule(self, vital):
+        """Return the compiled rule of a vital, recompiled on new limits."""
+        profile = threshold_profile()
+        if profile is not self._profile:
+            self._rules.clear()
+            self._profile = profile
+        rule = self._rules.get(vital)
+        if rule is None:
+            rule = self._rules[vital] = compile_rule(
+                profile.edges[vital], self.policy.get(vital, {}))
+        return rule
+
+    def _candidate(self, rule, normalized, status, previous):
+        """Return status, unless it improves on previous within hysteresis."""
+        if SEVERITY[status] >= SEVERITY[previous]:
+            return status
+        leaving = BAND_STATUS[bisect_right(rule.exit_edges, normalized)]
+        return leaving if SEVERITY[leaving] < SEVERITY[previous] else previous
+
+    def _slot(self, pending, vital):
+        """Return the index of a vital, growing pending alerts that
+        predate the registration of the vital."""
+        index = self.vital_index[vital]
+        if index >= len(pending.status):
+            pending.grow(index + 1)
+        return index
+
+    def settle(self, patient_id, timestamp, vital, normalized, status,
+               previous):
+        """Return the status to report for a reading classified as status,
+        given the previously reported status (NO_STATUS if none)."""
+        rule = self._rule(vital)
+        candidate = self._candidate(rule, normalized, status, previous)
+        pending = self._pending_of(patient_id)
+        index = self._slot(pending, vital)
+        if candidate == previous:
+            pending.status[index] = NO_STATUS
+            return previous
+        return self._after_dwell(pending, index, timestamp, candidate,
+                                 previous, rule.dwell)
+
+    def _after_dwell(self, pending, index, timestamp, candidate, previous,
+                     dwell):
+        if pending.status[index] != candidate:
+            pending.status[index] = candidate
+            pending.since[index] = timestamp
+        held = timestamp - pending.since[index]
+        if held < _dwell_seconds(dwell, candidate, previous):
+            return previous
+        pending.status[index] = NO_STATUS
+        return candidate
+
+    def pending(self, patient_id):
+        """Return (status bytes, since array) waiting out their dwell
+        time for a patient, or None if the patient has none."""
+        pending = self._patients.get(patient_id)
+        if pending is not None:
+            return pending.status, pending.since
+        status = self._restored_status.get(patient_id)
+        if status is None:
+            return None
+        return status, array('d', self._restored_since[patient_id])
+
+    def load_pending(self, status, since):
+        """Start over from restored pending alerts, e.g. of a snapshot.
+
+        status and since map patient ids to the bytes of their pending
+        statuses and since times; as in MonitorEngine.load_states, they
+        are only copied out on the patient's next reading.
+        """
+        self._patients = {}
+        self._restored_status = status
+        self._restored_since = since
+
+    def forget(self, patient_id):
+        """Drop the pending alerts of a discharged patient."""
+        self._patients.pop(patient_id, None)
+        self._restored_status.pop(patient_id, None)
+        self._restored_since.pop(patient_id, None)
+
+
+def _dwell_seconds(dwell, candidate, previous):
+    """The first status of a vital is reported straight away."""
+    if previous == NO_STATUS:
+        return -math.inf
+    return dwell[candidate]
@@ -0,0 +1,156 @@
+"""Re-score archived readings under the current (or proposed) limits.
+
+Usage:
+    python backfill.py ARCHIVE... [--workers N] [--tolerance PERCENT]
+                       [--limits LIMITS.json] [--output SUMMARY.json]
+
+Archives are segment files written by ReadingStore (*.seg), vendor
+CSV exports (*.csv) or NDJSON files with one ingest-server reading per
+line. Files are shared out across a process pool, scored without
+printing and the per-file summaries merged: reading counts per status
+per vital, and the first and last critical time of every patient.
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, count
+
+from bulk_loader import BulkLoader
+from monitor import (STATUS_CRITICAL, set_warning_tolerance,
+                     update_vital_range)
+from reading_store import Segment
+
+STATUS_KEYS = ('ok', 'warning_low', 'warning_high', 'critical')
+
+
+class BackfillSummary:
+    """Status counts per vital and critical time span per patient."""
+
+    def __init__(self):
+        self.readings = 0
+        self.rejected = 0
+        self.counts = {}
+        self.critical = {}
+
+    def add(self, vital, status, readings=1):
+        """Add readings of a vital with a status to the counts."""
+        counts = self.counts.setdefault(vital, [0] * len(STATUS_KEYS))
+        counts[status] += readings
+        self.readings += readings
+
+    def critical_at(self, patient_id, timestamp):
+        """Widen a patient's critical span to include timestamp."""
+        span = self.critical.get(patient_id)
+        if span is None:
+            self.critical[patient_id] = [timestamp, timestamp]
+            return
+        span[0], span[1] = min(span[0], timestamp), max(span[1], timestamp)
+
+    def _add_counts(self, vital, counts):
+        for status, readings in enumerate(counts):
+            self.add(vital, status, readings)
+
+    def merge(self, other):
+        """Fold another summary into this one."""
+        for vital, counts in other.counts.items():
+            self._add_counts(vital, counts)
+        for patient_id, (first, last) in other.critical.items():
+            self.critical_at(patient_id, first)
+            self.critical_at(patient_id, last)
+        self.rejected += other.rejected
+
+    def as_dict(self):
+        return {
+            'readings': self.readings,
+            'rejected': self.rejected,
+            'counts': {vital: dict(zip(STATUS_KEYS, counts))
+                       for vital, counts in self.counts.items()},
+            'critical': {str(patient_id): {'first': first, 'last': last}
+                         for patient_id, (first, last)
+                         in self.critical.items()},
+        }
+
+
+def _score_block(summary, names, columns, statuses):
+    pairs = Counter(zip(columns.vitals, statuses))
+    for (vital_id, status), readings in pairs.items():
+        summary.add(names.vitals[vital_id], status, readings)
+    critical = map(STATUS_CRITICAL.__eq__, statuses)
+    for row in compress(count(), critical):
+        summary.critical_at(names.patients[columns.patients[row]],
+                            columns.timestamps[row])
+
+
+def score_segment(path):
+    """Re-score a segment file straight from its memory mapping."""
+    summary = BackfillSummary()
+    with Segment(path) as segment:
+        for block, statuses in zip(segment.blocks, segment.reclassify()):
+            _score_block(summary, segment.names, block.columns, statuses)
+    return summary
+
+
+def score_export(path):
+    """Re-score an NDJSON or CSV export through the bulk loader."""
+    summary = BackfillSummary()
+    loader = BulkLoader()
+    for batch in loader.load(path):
+        _score_block(summary, loader.names, batch, loader.classify(batch))
+    summary.rejected = loader.rejected
+    return summary
+
+
+def score_file(path):
+    """Re-score one archive, choosing the reader by file extension."""
+    if path.endswith('.seg'):
+        return score_segment(path)
+    return score_export(path)
+
+
+def configure_limits(tolerance=None, limits=None):
+    """Apply proposed limits in this process (also run in each worker)."""
+    if tolerance is not None:
+        set_warning_tolerance(tolerance)
+    _update_ranges(limits or {})
+
+
+def _update_ranges(limits):
+    for vital, fields in limits.items():
+        update_vital_range(vital, **fields)
+
+
+def backfill(paths, workers=None, tolerance=None, limits=None):
+    """Score every archive in a process pool and merge the summaries."""
+    total = BackfillSummary()
+    with ProcessPoolExecutor(workers, initializer=configure_limits,
+                             initargs=(tolerance, limits)) as pool:
+        for summary in pool.map(score_file, paths):
+            total.merge(summary)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('\n\n', 2)[2])
+    parser.add_argument('archives', nargs='+')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes to use (default: one per core)')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='warning tolerance percent to score with')
+    parser.add_argument('--limits', type=argparse.FileType(),
+                        help='JSON {vital: {"min": .., "max": ..}} overrides')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        default=sys.stdout)
+    args = parser.parse_args(argv)
+    limits = json.load(args.limits) if args.limits else None
+    summary = backfill(args.archives, args.workers, args.tolerance, limits)
+    json.dump(summary.as_dict(), args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
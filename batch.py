@@ -0,0 +1,137 @@
+from array import array
+from bisect import bisect_right
+from itertools import repeat
+
+from monitor import (BAND_STATUS, STATUS_CRITICAL, STATUS_OK,
+                     normalize_vital_value, report_status, threshold_profile)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Typecode of the status and verdict arrays (signed char, i.e. int8).
+# With NumPy available, numpy.frombuffer(statuses, numpy.int8) views a
+# result without copying.
+STATUS_TYPECODE = 'b'
+
+
+def _normalized(vital_name, values, units):
+    """Yield values converted to the standard unit of the vital."""
+    if units is None:
+        return values
+    return map(normalize_vital_value, repeat(vital_name), values, units)
+
+
+def _unit_rows(units):
+    """Return the per-row units, or an endless run of None without units."""
+    return repeat(None) if units is None else units
+
+
+def _report_column(vital_name, statuses, values, units):
+    """Display the warning or alert of every reading that is not ok."""
+    for status, value, unit in zip(statuses, values, _unit_rows(units)):
+        if status != STATUS_OK:
+            report_status(status, vital_name, value, unit)
+
+
+def _scalar_statuses(vital_name, edges, values, units):
+    """Classify one reading at a time with bisect; needs no NumPy."""
+    return array(STATUS_TYPECODE, [
+        BAND_STATUS[bisect_right(edges, value)]
+        for value in _normalized(vital_name, values, units)])
+
+
+def _normalized_array(vital_name, values, units):
+    """Return values as a float64 array in the standard unit, converting
+    all rows of each unit in one array operation."""
+    normalized = numpy.array(values, dtype=numpy.float64)
+    if units is None:
+        return normalized
+    unit_rows = numpy.array(units, dtype=object)
+    for unit in set(unit_rows.tolist()) - {None}:
+        rows = unit_rows == unit
+        normalized[rows] = normalize_vital_value(vital_name,
+                                                 normalized[rows], unit)
+    return normalized
+
+
+def _status_array(codes):
+    """Copy an int8 NumPy array into a status array, in one copy."""
+    statuses = array(STATUS_TYPECODE)
+    statuses.frombytes(codes)
+    return statuses
+
+
+def _vector_statuses(vital_name, edges, values, units):
+    """Classify the whole column with numpy.searchsorted over the edges."""
+    bands = numpy.searchsorted(
+        edges, _normalized_array(vital_name, values, units), side='right')
+    band_status = numpy.array(BAND_STATUS, dtype=numpy.int8)
+    return _status_array(band_status[bands])
+
+
+def _column_statuses():
+    """Return the column classifier: vectorized when NumPy is installed."""
+    return _scalar_statuses if numpy is None else _vector_statuses
+
+
+def classify_column(vital_name, values, units=None, report=False):
+    """Return an int8 array with the STATUS_* code of every reading.
+
+    values is any sequence of numbers (list, array.array, NumPy array);
+    units, if given, holds one unit (or None) per row. With NumPy the
+    column is converted and classified in array operations, otherwise
+    reading by reading. Nothing is printed unless report is true.
+    """
+    edges = threshold_profile().edges[vital_name]
+    statuses = _column_statuses()(vital_name, edges, values, units)
+    if report:
+        _report_column(vital_name, statuses, values, units)
+    return statuses
+
+
+def _row_count(columns):
+    """Return the number of rows of the columns, raising ValueError
+    unless every column has the same."""
+    lengths = set(map(len, columns.values()))
+    if len(lengths) > 1:
+        raise ValueError(f"Columns differ in length: {sorted(lengths)}")
+    return lengths.pop() if lengths else 0
+
+
+def _scalar_verdicts(statuses, rows):
+    """Return 1 for rows without a critical status, 0 otherwise."""
+    return array(STATUS_TYPECODE, [
+        STATUS_CRITICAL not in row for row in zip(*statuses.values())])
+
+
+def _vector_verdicts(statuses, rows):
+    """Return the verdicts of all rows at once from the worst status of
+    each row; STATUS_CRITICAL is the highest code."""
+    worst = numpy.full(rows, STATUS_OK, dtype=numpy.int8)
+    for column in statuses.values():
+        numpy.maximum(worst, numpy.frombuffer(column, numpy.int8), out=worst)
+    return _status_array((worst != STATUS_CRITICAL).astype(numpy.int8))
+
+
+def _verdicts():
+    """Return the verdict builder: vectorized when NumPy is installed."""
+    return _scalar_verdicts if numpy is None else _vector_verdicts
+
+
+def classify_batch(columns, units=None, report=False):
+    """Classify a table of readings given as one column per vital.
+
+    Returns (statuses, verdicts): statuses maps each vital to its int8
+    status array; verdicts holds 1 for rows vitals_ok would accept and 0
+    for rows with a critical vital. units maps vital names to per-row
+    unit columns.
+    """
+    rows = _row_count(columns)
+    units = units or {}
+    statuses = {
+        vital_name: classify_column(
+            vital_name, values, units.get(vital_name), report)
+        for vital_name, values in columns.items()}
+    return statuses, _verdicts()(statuses, rows)
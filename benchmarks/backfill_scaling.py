@@ -0,0 +1,50 @@
+"""Measure how backfill throughput scales with the number of workers.
+
+Run from the repository root:
+    python -m benchmarks.backfill_scaling --files 8 --patients 2000
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from backfill import backfill
+from benchmarks.stats import doubling_counts
+from engine import synthetic_feed
+from reading_store import ReadingStore
+
+
+def write_archives(directory, files, patients, seconds):
+    """Write synthetic segment files and return their paths."""
+    paths = []
+    for seed in range(files):
+        path = os.path.join(directory, f"archive-{seed}.seg")
+        store = ReadingStore(path)
+        for event in synthetic_feed(patients, 1.0, seconds, seed):
+            store.append(*event)
+        store.flush()
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=60)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_archives(directory, args.files, args.patients,
+                               args.seconds)
+        baseline = None
+        for workers in doubling_counts(min(args.files, os.cpu_count())):
+            started = perf_counter()
+            readings = backfill(paths, workers).readings
+            elapsed = perf_counter() - started
+            baseline = baseline or elapsed
+            print(f"{workers:3} workers: {readings / elapsed:12,.0f} "
+                  f"readings/s, speedup {baseline / elapsed:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Measure bulk loading throughput of NDJSON and CSV exports in MB/s.
+
+Run from the repository root:
+    python -m benchmarks.bulk_load --patients 2000 --seconds 120
+
+Each format is timed three ways: only splitting the file into lines
+(the I/O ceiling), BulkLoader with classification, and decoding every
+line with json.loads/csv followed by classify_vital per reading.
+"""
+import argparse
+import csv
+import json
+import os
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from time import perf_counter
+
+from bulk_loader import BulkLoader, read_lines
+from engine import synthetic_feed
+from ingest_server import parse_reading
+from monitor import classify_vital, panel_readings
+
+
+def _panel(readings):
+    return {reading.vital: {'value': reading.value, 'unit': reading.unit}
+            for reading in readings}
+
+
+def write_ndjson(path, feed):
+    """Write one reading line per patient and timestamp of the feed."""
+    with open(path, 'w') as export:
+        for (patient, timestamp), readings in groupby(
+                feed, itemgetter(0, 1)):
+            export.write(json.dumps({'patient_id': patient,
+                                     'timestamp': timestamp,
+                                     'vitals': _panel(readings)}) + '\n')
+
+
+def write_csv(path, feed):
+    """Write one line per reading of the feed."""
+    with open(path, 'w', newline='') as export:
+        rows = csv.writer(export)
+        rows.writerow(['patient_id', 'timestamp', 'vital', 'value', 'unit'])
+        rows.writerows((*reading[:4], reading.unit or '') for reading in feed)
+
+
+def split_lines(path):
+    with open(path, 'rb') as export:
+        return sum(map(len, read_lines(export)))
+
+
+def bulk_load(path):
+    loader = BulkLoader()
+    return sum(len(loader.classify(batch)) for batch in loader.load(path))
+
+
+def _classify_rows(rows):
+    return sum(1 for row in rows if classify_vital(*row) is not None)
+
+
+def per_line_ndjson(path):
+    with open(path, 'rb') as export:
+        return sum(_classify_rows(panel_readings(parse_reading(line)[2]))
+                   for line in export)
+
+
+def per_line_csv(path):
+    with open(path, newline='') as export:
+        rows = csv.DictReader(export)
+        return _classify_rows((row['vital'], float(row['value']),
+                               row['unit'] or None) for row in rows)
+
+
+def _timed(load, path):
+    started = perf_counter()
+    load(path)
+    elapsed = perf_counter() - started
+    return os.path.getsize(path) / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=120)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        exports = {'ndjson': (write_ndjson, per_line_ndjson),
+                   'csv': (write_csv, per_line_csv)}
+        for extension, (write, per_line) in exports.items():
+            path = os.path.join(directory, f"export.{extension}")
+            write(path, synthetic_feed(args.patients, 1.0, args.seconds))
+            size = os.path.getsize(path) / 1e6
+            print(f"{extension} ({size:.1f} MB): "
+                  f"lines {_timed(split_lines, path):7.1f} MB/s, "
+                  f"bulk loader {_timed(bulk_load, path):6.1f} MB/s, "
+                  f"per line {_timed(per_line, path):6.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Measure MonitorEngine throughput on a synthetic multi-patient feed.
+
+Run from the repository root:
+    python -m benchmarks.engine_throughput --patients 10000 --rate 4
+    python -m benchmarks.engine_throughput --alerts   # with AlertTracker
+"""
+import argparse
+from time import perf_counter
+
+from alert_state import AlertTracker
+from engine import SYNTHETIC_VITALS, MonitorEngine, synthetic_feed
+
+
+def run(patients, rate_hz, duration, seed, alerts=False):
+    """Ingest a pre-generated feed and return (readings, transitions, s)."""
+    events = list(synthetic_feed(patients, rate_hz, duration, seed))
+    engine = MonitorEngine(AlertTracker() if alerts else None)
+    started = perf_counter()
+    transitions = sum(1 for _ in engine.ingest(events))
+    return len(events), transitions, perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--rate', type=float, default=4.0,
+                        help='readings per vital per second per patient')
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='simulated feed duration')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--alerts', action='store_true',
+                        help='settle statuses with hysteresis and dwell')
+    args = parser.parse_args()
+    readings, transitions, elapsed = run(
+        args.patients, args.rate, args.seconds, args.seed, args.alerts)
+    print(f"{readings} readings, {transitions} transitions "
+          f"in {elapsed:.3f}s: {readings / elapsed:,.0f} readings/s")
+    needed = args.patients * args.rate * len(SYNTHETIC_VITALS)
+    print(f"live feed needs {needed:,.0f} readings/s")
+
+
+if __name__ == '__main__':
+    main()
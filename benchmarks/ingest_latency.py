@@ -0,0 +1,61 @@
+"""Measure IngestServer latency and throughput with simulated devices.
+
+Run from the repository root:
+    python -m benchmarks.ingest_latency --devices 500 --readings 200
+"""
+import argparse
+import asyncio
+import functools
+import os
+import tempfile
+from time import perf_counter
+
+from benchmarks.stats import latency_summary
+from device_simulator import run_fleet
+from ingest_server import IngestServer
+
+
+async def _connect_to(server, args, directory):
+    """Start a listener and return a coroutine function connecting to it."""
+    if args.unix:
+        path = os.path.join(directory, 'monitor.sock')
+        await server.start_unix(path)
+        return functools.partial(asyncio.open_unix_connection, path)
+    listener = await server.start_tcp()
+    port = listener.sockets[0].getsockname()[1]
+    return functools.partial(asyncio.open_connection, '127.0.0.1', port)
+
+
+async def run(args):
+    """Run the fleet against a fresh server; return (latencies, seconds)."""
+    server = IngestServer(queue_size=args.queue_size)
+    with tempfile.TemporaryDirectory() as directory:
+        connect = await _connect_to(server, args, directory)
+        started = perf_counter()
+        latencies = await run_fleet(
+            connect, args.devices, args.readings, args.rate)
+        elapsed = perf_counter() - started
+        await server.close()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=100,
+                        help='readings sent by each device')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='readings per second per device (default: max)')
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--unix', action='store_true',
+                        help='use a Unix domain socket instead of TCP')
+    args = parser.parse_args()
+    latencies, elapsed = asyncio.run(run(args))
+    print(f"{len(latencies)} readings from {args.devices} devices "
+          f"in {elapsed:.2f}s: {len(latencies) / elapsed:,.0f} readings/s")
+    for name, micros in latency_summary(latencies).items():
+        print(f"  {name:>6}: {micros / 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Show patient-specific limits add nothing to per-reading resolution cost.
+
+A warm cache hit is one dict lookup whether the patient has custom
+limits or not. The cost still grows with the number of patients, as the
+cache outgrows the CPU caches, and jumps once it outgrows the resolver's
+capacity (limits.DEFAULT_CACHE_SIZE entries).
+
+Run from the repository root:
+    python -m benchmarks.limits_resolution --patients 30000
+"""
+import argparse
+import random
+from time import perf_counter
+
+from limits import LimitResolver
+
+AGES = (0.5, 6, 15, 40, 80)
+
+
+def _resolver(patients, custom, seed):
+    """Build a resolver with patients of mixed ages, custom ones overridden."""
+    rng = random.Random(seed)
+    resolver = LimitResolver()
+    for patient in range(patients):
+        resolver.set_age(patient, rng.choice(AGES))
+    for patient in range(custom):
+        resolver.set_override(patient, 'pulse', min=rng.randint(40, 60),
+                              max=rng.randint(100, 130))
+    return resolver
+
+
+def _workload(patients, readings, seed):
+    rng = random.Random(seed)
+    return [(rng.randrange(patients), 'pulse', rng.gauss(80, 15))
+            for _ in range(readings)]
+
+
+def measure(patients, custom, readings, seed=0):
+    """Return nanoseconds per classify call once the cache is warm."""
+    resolver = _resolver(patients, custom, seed)
+    workload = _workload(patients, readings, seed)
+    for patient, vital, value in workload:
+        resolver.classify(patient, vital, value)
+    started = perf_counter()
+    for patient, vital, value in workload:
+        resolver.classify(patient, vital, value)
+    return (perf_counter() - started) / readings * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=30000)
+    parser.add_argument('--readings', type=int, default=300000)
+    args = parser.parse_args()
+    scenarios = (('3 patients, age bands only', 3, 0),
+                 (f"{args.patients} patients, age bands only",
+                  args.patients, 0),
+                 (f"{args.patients} patients, all custom",
+                  args.patients, args.patients))
+    for name, patients, custom in scenarios:
+        cost = measure(patients, custom, args.readings)
+        print(f"{name:>40}: {cost:7.1f} ns/reading")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measure how sharded live evaluation scales with the number of workers.
+
+Run from the repository root:
+    python -m benchmarks.shard_scaling --patients 2000 --seconds 30
+"""
+import argparse
+import os
+from time import perf_counter
+
+from alert_state import AlertTracker
+from benchmarks.stats import doubling_counts
+from engine import MonitorEngine, synthetic_feed
+from sharded import ShardedMonitor
+
+
+def single(feed):
+    """Return readings/s of one in-process MonitorEngine."""
+    engine = MonitorEngine(alerts=AlertTracker())
+    started = perf_counter()
+    for _ in engine.ingest(feed):
+        pass
+    return len(feed) / (perf_counter() - started)
+
+
+def sharded(feed, shards):
+    """Return readings/s of a ShardedMonitor, workers already running."""
+    with ShardedMonitor(shards, alerts=True) as monitor:
+        started = perf_counter()
+        for _ in monitor.ingest(feed):
+            pass
+        return len(feed) / (perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--max-shards', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    feed = list(synthetic_feed(args.patients, 1.0, args.seconds))
+    # Each shard needs a core of its own besides the coordinator's
+    print(f"{'cores':>16}: {os.cpu_count():12}")
+    print(f"{'single engine':>16}: {single(feed):12,.0f} readings/s")
+    for shards in doubling_counts(args.max_shards):
+        print(f"{shards:>9} shards: {sharded(feed, shards):12,.0f} "
+              f"readings/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure snapshot write and restore time by number of patients.
+
+Run from the repository root:
+    python -m benchmarks.snapshot_restore --patients 10000 50000
+
+Snapshotter rewrites the whole file every SNAPSHOT_INTERVAL seconds, so
+the write time is also shown as a share of that interval: the part of
+one core the snapshots take from ingestion.
+"""
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+from alert_state import AlertTracker
+from engine import MonitorEngine, synthetic_feed
+from snapshot import SNAPSHOT_INTERVAL, restore, write_snapshot
+
+
+def warmed_engine(patients, seconds):
+    """Return an engine with alert tracking that has seen a synthetic feed."""
+    engine = MonitorEngine(alerts=AlertTracker())
+    for _ in engine.ingest(synthetic_feed(patients, 1.0, seconds)):
+        pass
+    return engine
+
+
+def measure(engine, path):
+    """Return (write seconds, restore seconds, file bytes)."""
+    started = perf_counter()
+    write_snapshot(engine, path)
+    written = perf_counter()
+    restore(path)
+    return written - started, perf_counter() - written, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'engine.snap')
+        for patients in args.patients:
+            engine = warmed_engine(patients, args.seconds)
+            write, load, size = measure(engine, path)
+            print(f"{patients:>8} patients: write {write * 1e3:7.1f} ms "
+                  f"({write / SNAPSHOT_INTERVAL:6.2%} of the interval)  "
+                  f"restore {load * 1e3:7.1f} ms  {size / 1024:8.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
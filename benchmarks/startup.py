@@ -0,0 +1,87 @@
+"""Measure import plus first classification in a fresh interpreter.
+
+Run from the repository root:
+    python -m benchmarks.startup --runs 20
+
+Each run starts a new python process that imports a module and
+classifies one reading, so nothing is shared with earlier runs. The
+child reports its own import and first-call times and which of the
+alert and I/O modules ended up loaded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+from benchmarks.stats import latency_summary
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMINGS = ('import', 'first_classify', 'process')
+# Modules a checker that only classifies should not pay for
+HEAVY_MODULES = ('alert_dispatch', 'vitals_report', 'logging', 'threading',
+                 'queue')
+
+CHILD = """
+import json, sys
+from time import perf_counter
+started = perf_counter()
+import {module}
+imported = perf_counter()
+{module}.classify_vital('temperature', 37.2, 'C')
+classified = perf_counter()
+print(json.dumps({{
+    'import': imported - started,
+    'first_classify': classified - imported,
+    'loaded': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def run_once(module):
+    """Return the child's timings plus the wall time of the whole process."""
+    code = CHILD.format(module=module, heavy=HEAVY_MODULES)
+    started = perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    result['process'] = perf_counter() - started
+    return result
+
+
+def _timing(results, key):
+    return latency_summary([result[key] for result in results])
+
+
+def measure(module, runs):
+    """Return latency summaries over runs fresh interpreters."""
+    results = [run_once(module) for _ in range(runs)]
+    summary = {key: _timing(results, key) for key in TIMINGS}
+    summary['loaded'] = results[-1]['loaded']
+    return summary
+
+
+def report(module, summary):
+    """Print the p50 and p90 of each timing and the heavy modules loaded."""
+    for key in TIMINGS:
+        stats = summary[key]
+        print(f"{module:>12} {key:>15}: p50 {stats['p50']:9.1f} us"
+              f"  p90 {stats['p90']:9.1f} us")
+    loaded = ', '.join(summary['loaded']) or 'none'
+    print(f"{module:>12} {'heavy modules':>15}: {loaded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--modules', nargs='+',
+                        default=['vitals_core', 'monitor'])
+    args = parser.parse_args()
+    for module in args.modules:
+        report(module, measure(module, args.runs))
+
+
+if __name__ == '__main__':
+    main()
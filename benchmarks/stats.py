@@ -0,0 +1,26 @@
+"""Summary statistics shared by the benchmark scripts."""
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile(ordered, point):
+    """Return the nearest-rank percentile of an already sorted list."""
+    rank = max(0, min(len(ordered) - 1, round(point / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(samples, points=PERCENTILES):
+    """Return {'p50': ..., 'max': ...} in microseconds for samples in s."""
+    ordered = sorted(samples)
+    summary = {f"p{point:g}": percentile(ordered, point) * 1e6
+               for point in points}
+    summary['max'] = ordered[-1] * 1e6
+    return summary
+
+
+def doubling_counts(limit):
+    """Return 1, 2, 4, ... up to limit: the worker counts to measure."""
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    return counts
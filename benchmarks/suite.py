@@ -0,0 +1,241 @@
+"""Benchmark every public monitor entry point on mixed-status workloads.
+
+Run from the repository root:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare results.json
+
+Workloads are mostly ok readings with some warnings and a few criticals,
+temperatures in both Celsius and Fahrenheit and panels in both the
+simple and the {'value', 'unit'} shape. Results are JSON so runs of
+different versions can be compared; --compare exits non-zero when a
+median latency regressed by more than --threshold percent.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import sys
+import tracemalloc
+from time import perf_counter, perf_counter_ns
+
+from alert_dispatch import AlertDispatcher, set_default_dispatcher
+from benchmarks.stats import latency_summary
+from monitor import (VITAL_RANGES, check_vital_with_warning, classify_vital,
+                     is_in_warning_range, is_vital_ok, panel_report,
+                     panel_verdict, threshold_profile, vitals_ok)
+from vital_registry import fahrenheit_to_celsius
+
+# Share of readings per band: ok, warning, critical
+STATUS_MIX = (('ok', 0.85), ('warning', 0.12), ('critical', 0.03))
+# Width used for bands that are open-ended
+OPEN_BAND_WIDTH = 10
+ALLOCATION_SAMPLES = 200
+
+
+class _DiscardSink:
+    def deliver(self, alert):
+        pass
+
+
+def _finite(low, high):
+    """Close an open-ended band so it can be sampled."""
+    if math.isinf(low):
+        low = high - OPEN_BAND_WIDTH
+    if math.isinf(high):
+        high = low + OPEN_BAND_WIDTH
+    return low, high
+
+
+def _bands(vital):
+    """Return the sampling bands of a vital per status category."""
+    low, ok_min, high_min, high = threshold_profile().edges[vital]
+    return {
+        'ok': [_finite(ok_min, high_min)],
+        'warning': [(low, ok_min), (high_min, high)],
+        'critical': [(low - OPEN_BAND_WIDTH, low),
+                     (high, high + OPEN_BAND_WIDTH)],
+    }
+
+
+def _usable(bands):
+    return [band for band in bands if not math.isinf(band[0] + band[1])]
+
+
+def _band(rng, vital):
+    """Draw a status category by STATUS_MIX and return one of its bands."""
+    categories, weights = zip(*STATUS_MIX)
+    bands = _bands(vital)
+    category = rng.choices(categories, weights)[0]
+    return rng.choice(_usable(bands[category]) or bands['ok'])
+
+
+def _with_unit(rng, vital, value):
+    """Attach a unit, giving half the temperatures in Celsius."""
+    if vital != 'temperature':
+        return value, None
+    if rng.random() < 0.5:
+        return round(fahrenheit_to_celsius(value), 2), 'C'
+    return value, 'F'
+
+
+def _reading(rng, vital):
+    """Return a (value, unit) reading in a randomly drawn status band."""
+    low, high = _band(rng, vital)
+    return _with_unit(rng, vital, round(rng.uniform(low, high), 2))
+
+
+def scalar_workload(rng, size):
+    """Return (vital, value, unit) argument tuples across all vitals."""
+    vitals = list(VITAL_RANGES)
+    return [(vital, *_reading(rng, vital))
+            for vital in rng.choices(vitals, k=size)]
+
+
+def _shaped(value, unit, rng):
+    if unit is None and rng.random() < 0.5:
+        return value
+    return {'value': value, 'unit': unit}
+
+
+def _panel(rng):
+    return {vital: _shaped(*_reading(rng, vital), rng)
+            for vital in VITAL_RANGES}
+
+
+def panel_workload(rng, size):
+    """Return single-argument tuples holding vitals panels."""
+    return [(_panel(rng),) for _ in range(size)]
+
+
+# Entry point name, function, workload builder, readings per call
+ENTRY_POINTS = (
+    ('classify_vital', classify_vital, scalar_workload, 1),
+    ('is_vital_ok', is_vital_ok, scalar_workload, 1),
+    ('is_in_warning_range', is_in_warning_range, scalar_workload, 1),
+    ('check_vital_with_warning', check_vital_with_warning,
+     scalar_workload, 1),
+    ('vitals_ok', vitals_ok, panel_workload, len(VITAL_RANGES)),
+    ('panel_verdict', panel_verdict, panel_workload, len(VITAL_RANGES)),
+    ('panel_report', panel_report, panel_workload, len(VITAL_RANGES)),
+)
+
+
+def _latencies(function, workload):
+    samples = []
+    for arguments in workload:
+        started = perf_counter_ns()
+        function(*arguments)
+        samples.append((perf_counter_ns() - started) / 1e9)
+    return samples
+
+
+def _throughput(function, workload, readings_per_call):
+    started = perf_counter()
+    for arguments in workload:
+        function(*arguments)
+    return len(workload) * readings_per_call / (perf_counter() - started)
+
+
+def _allocations(function, workload):
+    """Return (peak bytes allocated per call, net blocks left per call)."""
+    sample = workload[:ALLOCATION_SAMPLES]
+    tracemalloc.start()
+    peaks = 0
+    blocks = sys.getallocatedblocks()
+    for arguments in sample:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(*arguments)
+        peaks += tracemalloc.get_traced_memory()[1] - before
+    net_blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return peaks / len(sample), net_blocks / len(sample)
+
+
+def measure(function, workload, readings_per_call):
+    """Return the result record of one entry point."""
+    function(*workload[0])
+    peak_bytes, net_blocks = _allocations(function, workload)
+    return {
+        'readings_per_second': _throughput(function, workload,
+                                           readings_per_call),
+        'latency_us': latency_summary(_latencies(function, workload)),
+        'allocated_bytes_per_call': peak_bytes,
+        'net_blocks_per_call': net_blocks,
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Swallow warnings and alerts so only monitor work is timed."""
+    dispatcher = AlertDispatcher([_DiscardSink()], maxsize=0).start()
+    previous = set_default_dispatcher(dispatcher)
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+    set_default_dispatcher(previous)
+    dispatcher.stop()
+
+
+def run(calls, seed=0):
+    """Benchmark every entry point and return the JSON-ready results."""
+    results = {}
+    with _quiet():
+        for name, function, build, readings_per_call in ENTRY_POINTS:
+            workload = build(random.Random(seed), calls)
+            results[name] = measure(function, workload, readings_per_call)
+    return {'python': platform.python_version(), 'calls': calls,
+            'seed': seed, 'results': results}
+
+
+def _p50_change(before, after):
+    """Return the change in median latency, in percent."""
+    return (after['latency_us']['p50'] / before['latency_us']['p50'] - 1) * 100
+
+
+def compare(baseline, current):
+    """Return {entry point: p50 change in percent} against a baseline."""
+    before = baseline['results']
+    return {name: _p50_change(before[name], result)
+            for name, result in current['results'].items() if name in before}
+
+
+def _check(baseline_file, results, threshold):
+    """Print the changes against a baseline; return 1 on a regression."""
+    changes = compare(json.load(baseline_file), results)
+    for name, change in changes.items():
+        print(f"{name:>26}: p50 {change:+6.1f}%")
+    return int(any(change > threshold for change in changes.values()))
+
+
+def _report(results):
+    for name, result in results['results'].items():
+        latency = result['latency_us']
+        print(f"{name:>26}: {result['readings_per_second']:12,.0f} "
+              f"readings/s  p50 {latency['p50']:6.2f}us  "
+              f"p99 {latency['p99']:6.2f}us  "
+              f"{result['allocated_bytes_per_call']:6.0f} B/call")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=argparse.FileType('w'))
+    parser.add_argument('--compare', type=argparse.FileType(),
+                        help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed p50 slowdown in percent')
+    args = parser.parse_args(argv)
+    results = run(args.calls, args.seed)
+    _report(results)
+    if args.output:
+        json.dump(results, args.output, indent=2)
+    if args.compare:
+        sys.exit(_check(args.compare, results, args.threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Stream vendor exports of readings into columnar batches.
+
+NDJSON files hold one ingest-server reading per line; CSV files start
+with a header naming at least the columns of CSV_FIELDS, in any order,
+and hold one reading per line (fields must not span lines). Files are
+read in large chunks, vital and unit names are resolved to ids once,
+and values are normalized on the way in, so each batch goes straight
+to BulkLoader.classify:
+
+    loader = BulkLoader(rejects=open('rejects.txt', 'wb'))
+    for batch in loader.load('export.ndjson'):
+        statuses = loader.classify(batch)
+
+Rows that cannot be read, including rows that are not valid UTF-8 and
+CSV rows with a missing or an extra field, are written to rejects and
+counted instead of raising.
+
+CSV chunks without quotes are split with str.split in one pass rather
+than parsed row by row. NDJSON stays bound by decoding each JSON panel
+in Python. Either way loading is CPU-bound, not I/O-bound;
+benchmarks/bulk_load.py compares both with only splitting lines.
+"""
+import csv
+import functools
+import json
+from array import array
+from itertools import chain, repeat
+from operator import call, itemgetter
+
+from monitor import READING_ERRORS, VITALS, extract_vital_data
+from reading_store import Columns, Names
+
+# Bytes read at a time; large enough to amortize the per-chunk work, small
+# enough that a chunk's decoded rows stay cheap for the garbage collector
+CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 65536
+CSV_FIELDS = ('patient_id', 'timestamp', 'vital', 'value', 'unit')
+# Typecodes of the timestamp, patient, vital and normalized value columns
+BATCH_TYPES = ('d', 'I', 'B', 'd')
+# Errors raised by a malformed row, an unknown vital or a bad unit
+LOAD_ERRORS = READING_ERRORS + (IndexError,)
+
+_JSON = json.JSONDecoder()
+
+
+def read_lines(stream, chunk_size=CHUNK_SIZE):
+    """Yield the lines of a binary stream as lists, one per chunk read."""
+    tail = b''
+    for chunk in iter(functools.partial(stream.read, chunk_size), b''):
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        yield lines
+    yield [tail]
+
+
+def _csv_columns(header):
+    """Return the column names of a header line, checking CSV_FIELDS."""
+    names = next(csv.reader([header.decode()]))
+    missing = set(CSV_FIELDS).difference(names)
+    if missing:
+        raise ValueError(f"CSV header lacks columns: {sorted(missing)}")
+    return names
+
+
+def _json_object(line):
+    """Decode one JSON line, rejecting anything after the value."""
+    text = line.decode().strip()
+    value, end = _JSON.raw_decode(text)
+    if end != len(text):
+        raise ValueError(f"Extra data after JSON value at {end}")
+    return value
+
+
+def _arrays(rows):
+    """Turn (timestamp, patient, vital, value) rows into typed columns."""
+    columns = list(zip(*rows)) or [()] * len(BATCH_TYPES)
+    return [array(typecode, column)
+            for typecode, column in zip(BATCH_TYPES, columns)]
+
+
+def _extend(columns, more):
+    for column, rows in zip(columns, more):
+        column.extend(rows)
+
+
+def _split(columns, rows):
+    """Return the first rows of columns, and the rest."""
+    return ([column[:rows] for column in columns],
+            [column[rows:] for column in columns])
+
+
+class BulkLoader:
+    """Load NDJSON or CSV exports as reading_store.Columns batches.
+
+    Batch columns hold timestamps, patient ids and vital ids indexing
+    names.patients and names.vitals, and values already in standard
+    units; statuses are left empty for classify(). rejects is a binary
+    file receiving every unreadable line.
+    """
+
+    def __init__(self, rejects=None, batch_size=DEFAULT_BATCH_SIZE,
+                 chunk_size=CHUNK_SIZE):
+        self.rejects = rejects
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.names = Names([], [])
+        self.rejected = 0
+        self._converters = {}
+
+    def _resolve(self, key):
+        """Resolve a (vital, unit) pair once to (vital id, converter)."""
+        vital, unit = key
+        spec = VITALS.spec(vital)
+        if spec.components is not None:
+            raise ValueError(f"{vital} needs one value per component")
+        convert = float if unit is None else spec.converters[unit]
+        vital_id = self.names.vital_index(vital)
+        converter = self._converters[key] = (vital_id, convert)
+        return converter
+
+    def converters_of(self, keys):
+        """Return the (vital id, converter) pair of every (vital, unit)."""
+        keys = list(keys)
+        for key in set(keys).difference(self._converters):
+            self._resolve(key)
+        return list(map(self._converters.__getitem__, keys))
+
+    def read(self, vital, value, unit):
+        """Return (vital id, normalized value) of a single reading."""
+        key = (vital, unit)
+        vital_id, convert = self._converters.get(key) or self._resolve(key)
+        return vital_id, convert(float(value))
+
+    def _reject(self, line):
+        self.rejected += 1
+        if self.rejects is not None:
+            self.rejects.write(line.rstrip(b'\r') + b'\n')
+
+    def _checked_rows(self, record_rows, line):
+        """Return the rows of one line, or none if it is rejected."""
+        try:
+            return record_rows(line)
+        except LOAD_ERRORS:
+            self._reject(line)
+            return ()
+
+    def _chunk_columns(self, reader, lines):
+        """Decode a chunk in one go; redo it line by line, sorting out
+        the rejects, if any line in it is malformed."""
+        lines = list(filter(bytes.strip, lines))
+        try:
+            return reader.columns(lines)
+        except LOAD_ERRORS:
+            checked = map(self._checked_rows, repeat(reader.record_rows),
+                          lines)
+            return _arrays(chain.from_iterable(checked))
+
+    def _full_batches(self, reader, chunks):
+        """Yield batches of batch_size rows; return the columns left."""
+        pending = _arrays(())
+        for lines in chunks:
+            _extend(pending, self._chunk_columns(reader, lines))
+            while len(pending[0]) >= self.batch_size:
+                batch, pending = _split(pending, self.batch_size)
+                yield Columns(*batch, array('b'))
+        return pending
+
+    def _batches(self, reader, chunks):
+        pending = yield from self._full_batches(reader, chunks)
+        if pending[0]:
+            yield Columns(*pending, array('b'))
+
+    def _reader(self, path, source):
+        if path.endswith('.csv'):
+            return _CsvReader(self, source.readline())
+        return _NdjsonReader(self)
+
+    def load(self, path):
+        """Yield batches of the readings of a .csv or NDJSON file."""
+        with open(path, 'rb') as source:
+            reader = self._reader(path, source)
+            chunks = read_lines(source, self.chunk_size)
+            yield from self._batches(reader, chunks)
+
+    def classify(self, batch):
+        """Fill in and return the STATUS_* codes of a batch."""
+        batch.statuses = batch.reclassify(self.names.vital_edges())
+        return batch.statuses
+
+
+class _NdjsonReader:
+    """Decode ingest-server reading lines for a BulkLoader."""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def columns(self, lines):
+        return _arrays(chain.from_iterable(map(self.record_rows, lines)))
+
+    def _vital_rows(self, vital, vital_data):
+        """Return the (vital id, normalized value) pairs of a panel entry,
+        one per component of a multi-component vital."""
+        value, unit = extract_vital_data(vital_data)
+        components = VITALS.spec(vital).components
+        if components is None:
+            return (self.loader.read(vital, value, unit),)
+        return [self.loader.read(component, part, unit)
+                for component, part in zip(components, value, strict=True)]
+
+    def _panel_rows(self, vitals):
+        return [pair for vital, vital_data in vitals.items()
+                for pair in self._vital_rows(vital, vital_data)]
+
+    def record_rows(self, line):
+        reading = _json_object(line)
+        pairs = self._panel_rows(reading['vitals'])
+        prefix = (float(reading.get('timestamp')),
+                  self.loader.names.patient_index(reading.get('patient_id')))
+        return [(*prefix, *pair) for pair in pairs]
+
+
+class _CsvReader:
+    """Decode CSV reading rows for a BulkLoader, a column at a time."""
+
+    def __init__(self, loader, header):
+        self.loader = loader
+        names = _csv_columns(header)
+        self.width = len(names)
+        self.positions = list(map(names.index, CSV_FIELDS))
+        self.pick = itemgetter(*self.positions)
+
+    def _quoted_fields(self, text, lines):
+        """Return the CSV_FIELDS columns of rows parsed with csv."""
+        records = list(csv.reader(text.splitlines()))
+        if set(map(len, records)) != {self.width}:
+            raise ValueError("Row with a missing or an extra field")
+        return [list(map(itemgetter(position), records))
+                for position in self.positions]
+
+    def _split_fields(self, text, lines):
+        """Return the CSV_FIELDS columns of unquoted rows, split at every
+        comma of the chunk at once."""
+        if set(map(bytes.count, lines, repeat(b','))) != {self.width - 1}:
+            raise ValueError("Row with a missing or an extra field")
+        fields = text.replace('\r', '').replace('\n', ',').split(',')
+        return [fields[position::self.width] for position in self.positions]
+
+    def _fields(self, lines):
+        """Return the CSV_FIELDS columns of a chunk's lines."""
+        text = b'\n'.join(lines).decode()
+        split = self._quoted_fields if '"' in text else self._split_fields
+        return split(text, lines)
+
+    def columns(self, lines):
+        """Return the typed columns of a chunk, built column by column."""
+        patient_ids, timestamps, vitals, values, units = self._fields(lines)
+        units = [unit or None for unit in units]
+        converters = self.loader.converters_of(zip(vitals, units))
+        normalized = array('d', map(call, map(itemgetter(1), converters),
+                                    map(float, values)))
+        timestamps = array('d', map(float, timestamps))
+        patients = array('I', self.loader.names.patient_indices(patient_ids))
+        return [timestamps, patients,
+                array('B', map(itemgetter(0), converters)), normalized]
+
+    def record_rows(self, line):
+        row = next(csv.reader([line.decode()]))
+        if len(row) != self.width:
+            raise ValueError("Row with a missing or an extra field")
+        patient_id, timestamp, vital, value, unit = self.pick(row)
+        vital_id, normalized = self.loader.read(vital, value, unit or None)
+        return ((float(timestamp), self.loader.names.patient_index(patient_id),
+                 vital_id, normalized),)
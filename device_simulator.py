@@ -0,0 +1,65 @@
+import asyncio
+import json
+import random
+from collections import deque
+from itertools import chain
+from time import perf_counter
+
+from engine import SYNTHETIC_VITALS
+
+
+def _panel(rng):
+    """Return one vitals panel, temperature in both supported shapes."""
+    panel = {vital: round(rng.gauss(mean, spread), 1)
+             for vital, (mean, spread, _) in SYNTHETIC_VITALS.items()}
+    if rng.random() < 0.5:
+        celsius = round((panel['temperature'] - 32) * 5 / 9, 1)
+        panel['temperature'] = {'value': celsius, 'unit': 'C'}
+    return panel
+
+
+def device_lines(patient_id, count, seed=0, start=0.0, rate_hz=1.0):
+    """Return count encoded NDJSON readings for one simulated device."""
+    rng = random.Random(f"{seed}:{patient_id}")
+    return [json.dumps({'patient_id': patient_id,
+                        'timestamp': start + tick / rate_hz,
+                        'vitals': _panel(rng)}).encode() + b'\n'
+            for tick in range(count)]
+
+
+async def _collect_replies(reader, sent_at, count, latencies):
+    """Match replies to send times in order and record each latency."""
+    for _ in range(count):
+        await reader.readline()
+        latencies.append(perf_counter() - sent_at.popleft())
+
+
+async def run_device(connect, patient_id, count, rate_hz=None, seed=0):
+    """Stream count readings over one connection; return reply latencies.
+
+    connect is a coroutine function opening the connection, for example
+    functools.partial(asyncio.open_connection, host, port). Without a
+    rate the device sends as fast as the server accepts.
+    """
+    reader, writer = await connect()
+    sent_at, latencies = deque(), []
+    replies = asyncio.create_task(
+        _collect_replies(reader, sent_at, count, latencies))
+    pause = 1 / rate_hz if rate_hz else 0
+    for line in device_lines(patient_id, count, seed):
+        sent_at.append(perf_counter())
+        writer.write(line)
+        await writer.drain()
+        await asyncio.sleep(pause)
+    await replies
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+async def run_fleet(connect, devices, count, rate_hz=None, seed=0):
+    """Run many devices concurrently and return all reply latencies."""
+    results = await asyncio.gather(*[
+        run_device(connect, f"device-{device}", count, rate_hz, seed)
+        for device in range(devices)])
+    return list(chain.from_iterable(results))
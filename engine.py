@@ -0,0 +1,143 @@
+import random
+from collections import namedtuple
+
+from monitor import VITALS, normalize_vital_value, threshold_profile
+
+# Marks a vital that has not been read yet for a patient
+NO_STATUS = 0xFF
+
+Reading = namedtuple(
+    'Reading', ['patient_id', 'timestamp', 'vital', 'value', 'unit'])
+Transition = namedtuple(
+    'Transition',
+    ['patient_id', 'timestamp', 'vital', 'previous', 'status', 'value'])
+
+# Mean, spread and unit of the synthetic readings per vital
+SYNTHETIC_VITALS = {
+    'temperature': (98.4, 1.3, 'F'),
+    'pulse': (78, 10, None),
+    'spo2': (96, 2.4, None),
+}
+
+
+def _status_at(state, index):
+    """Return the status byte at index, NO_STATUS past the end of state."""
+    return state[index] if index < len(state) else NO_STATUS
+
+
+def _unsettled(patient_id, timestamp, vital, normalized, status, previous):
+    return status
+
+
+class MonitorEngine:
+    """Keep the latest status of every patient and report status changes.
+
+    State per patient is one byte per vital, indexed by the vital's id
+    in the VITALS registry and grown for vitals registered later;
+    restored states, see load_states, are copied in on a patient's first
+    reading. An alert_state.AlertTracker passed as alerts settles raw
+    statuses first, so flapping readings do not produce transitions.
+    """
+
+    def __init__(self, alerts=None):
+        # The registry's vital ids, shared so later registrations show up
+        self.vital_index = VITALS.ids
+        self.readings = 0
+        self.alerts = alerts
+        self._settle = _unsettled if alerts is None else alerts.settle
+        self._patients = {}
+        self._restored = {}
+
+    def __len__(self):
+        return len(self._patients) + len(self._restored)
+
+    def _state_of(self, patient_id):
+        state = self._patients.get(patient_id)
+        if state is None:
+            restored = self._restored.pop(patient_id, None)
+            if restored is None:
+                state = bytearray([NO_STATUS]) * len(self.vital_index)
+            else:
+                state = bytearray(restored)
+            self._patients[patient_id] = state
+        return state
+
+    def status(self, patient_id, vital):
+        """Return the latest STATUS_* code of a vital, or None if unseen."""
+        state = self._patients.get(patient_id)
+        if state is None:
+            state = self._restored.get(patient_id, b'')
+        status = _status_at(state, self.vital_index[vital])
+        return None if status == NO_STATUS else status
+
+    def _slot(self, state, vital):
+        """Return the index of a vital in state, growing a state that
+        predates the registration of the vital."""
+        index = self.vital_index[vital]
+        if index >= len(state):
+            state.extend(bytes([NO_STATUS]) * (index + 1 - len(state)))
+        return index
+
+    def observe(self, patient_id, timestamp, vital, value, unit=None):
+        """Record one reading; return a Transition if its status changed."""
+        self.readings += 1
+        normalized = normalize_vital_value(vital, value, unit)
+        status = threshold_profile().classify(vital, normalized)
+        state = self._state_of(patient_id)
+        index = self._slot(state, vital)
+        previous = state[index]
+        status = self._settle(patient_id, timestamp, vital, normalized,
+                              status, previous)
+        if previous == status:
+            return None
+        state[index] = status
+        previous = None if previous == NO_STATUS else previous
+        return Transition(patient_id, timestamp, vital, previous, status, value)
+
+    def patient_states(self):
+        """Return (patient_id, state) pairs of every patient seen.
+
+        Each list is taken in one step, so ingestion can go on while the
+        caller copies the states; each state is one byte per vital. A
+        patient read in between is listed twice, the live state last.
+        """
+        return [*self._restored.items(), *self._patients.items()]
+
+    def load_states(self, restored, readings=0):
+        """Start over from restored states, e.g. those of a snapshot.
+
+        restored maps patient ids to state bytes and needs get, pop,
+        items and len; a patient's state is only copied out of it on the
+        patient's next reading, so restoring does not touch every patient.
+        """
+        self._patients = {}
+        self._restored = restored
+        self.readings = readings
+
+    def ingest(self, events):
+        """Consume (patient_id, timestamp, vital, value, unit) events and
+        yield a Transition for every status change."""
+        observe = self.observe
+        for event in events:
+            transition = observe(*event)
+            if transition is not None:
+                yield transition
+
+
+def _synthetic_tick(rng, patients, timestamp):
+    """Yield one reading of every vital for every patient."""
+    for patient in range(patients):
+        for vital, (mean, spread, unit) in SYNTHETIC_VITALS.items():
+            value = round(rng.gauss(mean, spread), 1)
+            yield Reading(patient, timestamp, vital, value, unit)
+
+
+def synthetic_feed(patients, rate_hz=1.0, duration=60.0, seed=0, start=0.0):
+    """Yield a replayable, timestamp-ordered feed of synthetic readings.
+
+    Every patient reports every vital rate_hz times a second for duration
+    seconds; the same seed always produces the same feed.
+    """
+    rng = random.Random(seed)
+    for tick in range(int(duration * rate_hz)):
+        yield from _synthetic_tick(rng, patients, start + tick / rate_hz)
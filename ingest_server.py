@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+
+from engine import MonitorEngine
+from monitor import (READING_ERRORS, STATUS_CRITICAL, panel_readings,
+                     panel_report)
+
+DEFAULT_QUEUE_SIZE = 1024
+DEFAULT_BATCH_SIZE = 256
+WRITE_BUFFER_LIMIT = 64 * 1024
+
+REPLY_OK = b'{"ok": true}\n'
+REPLY_NOT_OK = b'{"ok": false}\n'
+
+
+def parse_reading(line):
+    """Decode one NDJSON reading into (patient_id, timestamp, vitals).
+
+    A reading looks like
+    {"patient_id": "bed-4", "timestamp": 1700000000.5,
+     "vitals": {"temperature": {"value": 37, "unit": "C"}, "pulse": 70}}
+    """
+    reading = json.loads(line)
+    return (reading.get('patient_id'), reading.get('timestamp'),
+            reading['vitals'])
+
+
+def _error_reply(error):
+    return (json.dumps({'error': str(error)}) + '\n').encode()
+
+
+async def _relieve(writer):
+    """Wait for a client that is not reading its replies to catch up."""
+    if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+        await writer.drain()
+
+
+class IngestServer:
+    """Evaluate newline-delimited JSON readings from many device sockets.
+
+    Every connection feeds raw lines into one bounded queue drained by a
+    single evaluator task. When evaluation falls behind the queue fills,
+    connections stop reading and the devices are pushed back on by the
+    socket buffers. Each line is answered with one JSON line, in order.
+    """
+
+    def __init__(self, engine=None, on_transition=None,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.engine = engine or MonitorEngine()
+        self.on_transition = on_transition
+        self.batch_size = batch_size
+        self.evaluated = 0
+        self.rejected = 0
+        self._queue = asyncio.Queue(queue_size)
+        self._servers = []
+        self._writers = set()
+        self._evaluator = None
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """Listen on a TCP port; port 0 picks a free one."""
+        return await self._start(
+            asyncio.start_server(self._handle_client, host, port))
+
+    async def start_unix(self, path):
+        """Listen on a Unix domain socket."""
+        return await self._start(
+            asyncio.start_unix_server(self._handle_client, path))
+
+    async def _start(self, opening):
+        server = await opening
+        self._servers.append(server)
+        if self._evaluator is None:
+            self._evaluator = asyncio.create_task(self._evaluate_forever())
+        return server
+
+    async def close(self):
+        """Stop listening, answer queued lines, hang up on the clients
+        still connected and stop the evaluator; closing again is a no-op."""
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        if self._evaluator is None:
+            return
+        await self._queue.join()
+        self._hang_up()
+        self._evaluator.cancel()
+        self._evaluator = None
+
+    def _hang_up(self):
+        """Close the connections of clients that did not disconnect."""
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    async def _read_lines(self, reader, writer):
+        """Queue every line a client sends until it disconnects."""
+        try:
+            async for line in reader:
+                await self._queue.put((line, writer))
+                await _relieve(writer)
+        except ConnectionError:
+            pass
+
+    async def _handle_client(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            await self._read_lines(reader, writer)
+        except ValueError as error:
+            # A line over the reader's limit; answer it, then hang up
+            await self._queue.put((error, writer))
+        finally:
+            await self._queue.put((None, writer))
+
+    def _take_ready(self):
+        """Take queued lines that are already waiting, up to a batch."""
+        ready = min(self._queue.qsize(), self.batch_size - 1)
+        return [self._queue.get_nowait() for _ in range(ready)]
+
+    async def _evaluate_forever(self):
+        while True:
+            batch = [await self._queue.get()]
+            batch.extend(self._take_ready())
+            for line, writer in batch:
+                self._answer_safely(line, writer)
+                self._queue.task_done()
+            await asyncio.sleep(0)
+
+    def _answer_safely(self, line, writer):
+        """Answer a line; an unexpected error is logged so the evaluator
+        keeps serving every other line."""
+        try:
+            self._answer(line, writer)
+        except Exception:
+            logging.getLogger(__name__).exception('Answering a line failed')
+
+    def _answer(self, line, writer):
+        if line is None:
+            writer.close()
+            self._writers.discard(writer)
+            return
+        reply = self._reply_to(line)
+        if not writer.is_closing():
+            writer.write(reply)
+
+    def _reply_to(self, line):
+        """Return the reply to a line, or to the error reading it."""
+        if isinstance(line, Exception):
+            self.rejected += 1
+            return _error_reply(line)
+        return self.evaluate_line(line)
+
+    def evaluate_line(self, line):
+        """Evaluate one raw NDJSON line and return the reply line."""
+        try:
+            ok = self.evaluate(*parse_reading(line))
+        except READING_ERRORS as error:
+            self.rejected += 1
+            return _error_reply(error)
+        return REPLY_OK if ok else REPLY_NOT_OK
+
+    def evaluate(self, patient_id, timestamp, vitals):
+        """Feed a panel to the engine; False if any vital is critical.
+
+        The whole panel is classified first, so a panel with an unknown
+        vital or a bad value or unit raises before the engine records
+        any of its readings.
+        """
+        panel_report(vitals)
+        statuses = [self._observe(patient_id, timestamp, *reading)
+                    for reading in panel_readings(vitals)]
+        self.evaluated += 1
+        return STATUS_CRITICAL not in statuses
+
+    def _observe(self, patient_id, timestamp, vital_name, value, unit):
+        transition = self.engine.observe(
+            patient_id, timestamp, vital_name, value, unit)
+        if transition is not None and self.on_transition is not None:
+            self._notify(transition)
+        return self.engine.status(patient_id, vital_name)
+
+    def _notify(self, transition):
+        """Pass a transition on; a failing callback is logged, not raised."""
+        try:
+            self.on_transition(transition)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                'Transition callback failed')
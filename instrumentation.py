@@ -0,0 +1,401 @@
+"""Opt-in metrics and profiling of the monitor evaluation pipeline.
+
+enable() swaps instrumented wrappers in for monitor's normalization,
+classification, check and output functions, and for the methods the
+streaming pipeline feeds readings through: MonitorEngine.observe,
+IngestServer.evaluate, TrendMonitor.observe, LimitResolver.classify
+and ShardedMonitor.submit. disable() puts the originals back, so
+nothing is paid while instrumentation is off.
+
+Functions are replaced in monitor and in the modules defining them,
+vitals_core and vitals_report; names imported with "from monitor
+import ..." before enable() keep the originals. Methods are replaced on
+their classes, so every instance, whenever created, is measured.
+Sharded workers run in their own processes and are not measured.
+
+    metrics = instrumentation.enable()
+    server = instrumentation.serve(metrics, port=9464)  # GET /metrics
+    metrics.dump('/var/tmp/monitor.prom')
+"""
+import functools
+import importlib
+import os
+import sys
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import accumulate
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlsplit
+
+import monitor
+import vitals_core
+import vitals_report
+from periodic import PeriodicThread
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (1e-7, 2.5e-7, 5e-7, 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5,
+                   5e-5, 1e-4, 1e-3, 1e-2)
+STATUS_LABELS = ('ok', 'warning_low', 'warning_high', 'critical')
+METRIC_HELP = {
+    'monitor_call_seconds': 'Latency of monitor functions per vital.',
+    'monitor_readings_total': 'Classified readings per vital and status.',
+    'monitor_output_seconds': 'Latency of warning and alert output.',
+    'monitor_panel_seconds': 'Latency of evaluating one ingested panel.',
+}
+PROFILE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 30
+_LABEL_ESCAPES = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds, Prometheus style."""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """Return (upper bound, observations <= bound) pairs, +Inf last."""
+        bounds = [repr(bound) for bound in self.bounds] + ['+Inf']
+        return list(zip(bounds, accumulate(self.counts)))
+
+
+def _labels(labels, *extra):
+    pairs = labels + extra
+    return ','.join(f'{name}="{str(value).translate(_LABEL_ESCAPES)}"'
+                    for name, value in pairs)
+
+
+def _histogram_lines(name, labels, histogram):
+    for bound, observations in histogram.cumulative():
+        yield f"{name}_bucket{{{_labels(labels, ('le', bound))}}} " \
+              f"{observations}"
+    yield f"{name}_sum{{{_labels(labels)}}} {histogram.sum!r}"
+    yield f"{name}_count{{{_labels(labels)}}} {sum(histogram.counts)}"
+
+
+def _header(name, kind):
+    return [f"# HELP {name} {METRIC_HELP.get(name, name)}",
+            f"# TYPE {name} {kind}"]
+
+
+def _grouped(series):
+    """Group {(name, labels): value} by metric name, sorted."""
+    groups = {}
+    for (name, labels), value in sorted(series.items()):
+        groups.setdefault(name, []).append((labels, value))
+    return groups
+
+
+class Metrics:
+    """Counters and latency histograms, keyed by name and label pairs.
+
+    Updates and render() take one lock, so threads can share it.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def histogram(self, name, labels):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, name, labels, seconds):
+        """Record seconds in the histogram of name and labels."""
+        with self._lock:
+            self.histogram(name, labels).observe(seconds)
+
+    def _counter_lines(self):
+        for name, series in _grouped(dict(self.counters)).items():
+            yield from _header(name, 'counter')
+            yield from (f"{name}{{{_labels(labels)}}} {value}"
+                        for labels, value in series)
+
+    def _histogram_lines(self):
+        for name, series in _grouped(dict(self.histograms)).items():
+            yield from _header(name, 'histogram')
+            for labels, histogram in series:
+                yield from _histogram_lines(name, labels, histogram)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [*self._counter_lines(), *self._histogram_lines()]
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write render() to path, replacing the file atomically."""
+        partial = f"{path}.tmp"
+        with open(partial, 'w') as exported:
+            exported.write(self.render())
+        os.replace(partial, path)
+
+
+def _count_reading(metrics, vital_name, status):
+    labels = (('vital', vital_name), ('status', STATUS_LABELS[status]))
+    metrics.inc('monitor_readings_total', labels)
+
+
+def _timed(metrics, function, vital_at=0):
+    """Wrap a function taking the vital name as argument vital_at to
+    record its latency per vital."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def timed(*args):
+        started = perf_counter()
+        result = function(*args)
+        labels = (('function', name), ('vital', args[vital_at]))
+        metrics.observe('monitor_call_seconds', labels,
+                        perf_counter() - started)
+        return result
+    return timed
+
+
+def _counted(metrics, function, vital_at=0):
+    """Wrap a function returning a STATUS_* code to also count readings
+    per vital and status."""
+    timed = _timed(metrics, function, vital_at)
+
+    @functools.wraps(function)
+    def counted(*args):
+        status = timed(*args)
+        _count_reading(metrics, args[vital_at], status)
+        return status
+    return counted
+
+
+def _observed(metrics, observe):
+    """Wrap MonitorEngine.observe to also count readings per vital and
+    the status the engine recorded, if it recorded one yet."""
+    timed = _timed(metrics, observe, vital_at=3)
+
+    @functools.wraps(observe)
+    def observed(engine, patient_id, timestamp, vital, *args):
+        transition = timed(engine, patient_id, timestamp, vital, *args)
+        status = engine.status(patient_id, vital)
+        if status is not None:
+            _count_reading(metrics, vital, status)
+        return transition
+    return observed
+
+
+def _paneled(metrics, evaluate):
+    """Wrap IngestServer.evaluate to record the latency of each panel."""
+    labels = (('function', evaluate.__qualname__),)
+
+    @functools.wraps(evaluate)
+    def paneled(*args):
+        started = perf_counter()
+        result = evaluate(*args)
+        metrics.observe('monitor_panel_seconds', labels,
+                        perf_counter() - started)
+        return result
+    return paneled
+
+
+def _output(metrics, function):
+    """Wrap a message output to record its latency."""
+    labels = (('output', function.__name__),)
+
+    @functools.wraps(function)
+    def output(message):
+        started = perf_counter()
+        function(message)
+        metrics.observe('monitor_output_seconds', labels,
+                        perf_counter() - started)
+    return output
+
+
+# Instrumented monitor functions and the wrapper applied to each
+INSTRUMENTED = {
+    'normalize_vital_value': _timed,
+    'classify_vital': _counted,
+    'is_vital_ok': _timed,
+    'is_in_warning_range': _timed,
+    'warning_message': _output,
+    'alert_message': _output,
+}
+
+# Modules whose globals hold the instrumented functions
+MODULES = (vitals_core, vitals_report, monitor)
+
+# (module, class, method, wrapper) of the instrumented pipeline methods;
+# the vital name is argument vital_at of a method, self included
+INSTRUMENTED_METHODS = (
+    ('engine', 'MonitorEngine', 'observe', _observed),
+    ('ingest_server', 'IngestServer', 'evaluate', _paneled),
+    ('trends', 'TrendMonitor', 'observe',
+     functools.partial(_timed, vital_at=3)),
+    ('limits', 'LimitResolver', 'classify',
+     functools.partial(_counted, vital_at=2)),
+    ('sharded', 'ShardedMonitor', 'submit',
+     functools.partial(_timed, vital_at=3)),
+)
+
+# (module or class, name, original function) of every replacement
+_originals = []
+
+
+def _instrument(metrics, name, wrap):
+    """Replace function name with its wrapper wherever it is bound."""
+    original = getattr(monitor, name)
+    wrapped = wrap(metrics, original)
+    for module in MODULES:
+        if vars(module).get(name) is original:
+            _originals.append((module, name, original))
+            setattr(module, name, wrapped)
+
+
+def _instrument_method(metrics, module_name, class_name, name, wrap):
+    """Replace a method on its class with its wrapper."""
+    owner = getattr(importlib.import_module(module_name), class_name)
+    original = vars(owner)[name]
+    _originals.append((owner, name, original))
+    setattr(owner, name, wrap(metrics, original))
+
+
+def _instrument_methods(metrics):
+    for instrumented in INSTRUMENTED_METHODS:
+        _instrument_method(metrics, *instrumented)
+
+
+def enable(metrics=None):
+    """Instrument the monitor module and the pipeline methods and return
+    the Metrics they record to."""
+    disable()
+    metrics = metrics or Metrics()
+    for name, wrap in INSTRUMENTED.items():
+        _instrument(metrics, name, wrap)
+    _instrument_methods(metrics)
+    return metrics
+
+
+def disable():
+    """Restore the uninstrumented monitor functions and methods."""
+    for owner, name, original in _originals:
+        setattr(owner, name, original)
+    _originals.clear()
+
+
+def enabled():
+    return bool(_originals)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def folded_stack(frame):
+    """Return a stack as 'outer;...;inner' frame names."""
+    names = [_frame_name(caller) for caller, _ in traceback.walk_stack(frame)]
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler(PeriodicThread):
+    """Sample the stacks of every other thread from a background thread.
+
+    Start and stop it at any time; stacks counts how often each folded
+    stack was seen, and folded() renders them for flame graph tools.
+    """
+    thread_name = 'sampling-profiler'
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        super().__init__(interval)
+        self.stacks = Counter()
+
+    def tick(self):
+        self.sample(skip=threading.get_ident())
+
+    def sample(self, skip=None):
+        """Count the current stack of every thread except skip."""
+        for ident, frame in sys._current_frames().items():
+            if ident != skip:
+                self.stacks[folded_stack(frame)] += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {samples}\n"
+                       for stack, samples in self.stacks.most_common())
+
+
+def _metrics_page(server, query):
+    return server.metrics.render()
+
+
+def _profile_seconds(query):
+    """Return ?seconds=N (default 1), raising ValueError unless it is
+    between 0 and MAX_PROFILE_SECONDS."""
+    seconds = float(query.get('seconds', ['1'])[0])
+    if not 0 <= seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(
+            f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    return seconds
+
+
+def _profile_page(server, query):
+    """Profile every thread for ?seconds=N (default 1) and fold stacks."""
+    seconds = _profile_seconds(query)
+    profiler = SamplingProfiler().start()
+    sleep(seconds)
+    return profiler.stop().folded()
+
+
+PAGES = {'/metrics': _metrics_page, '/profile': _profile_page}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        page = PAGES.get(url.path)
+        if page is None:
+            self.send_error(404)
+            return
+        try:
+            body = page(self.server, parse_qs(url.query))
+        except ValueError as error:
+            self.send_error(400, str(error))
+            return
+        self._reply(body.encode())
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(metrics, port=9464, host='127.0.0.1'):
+    """Serve /metrics and /profile?seconds=N from a background thread.
+
+    Returns the server; call shutdown() and server_close() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True,
+                     name='metrics-server').start()
+    return server
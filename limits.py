@@ -0,0 +1,149 @@
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import islice
+
+from monitor import (AGE_BAND_LIMITS, AGE_BANDS, BAND_STATUS, VITAL_RANGES,
+                     compile_edges, normalize_vital_value, threshold_profile)
+
+DEFAULT_CACHE_SIZE = 131072
+DEFAULT_AGE_BAND = 'adult'
+
+Adjustment = namedtuple('Adjustment', ['clinician', 'limits'])
+
+_BAND_AGES = [age for age, _ in AGE_BANDS]
+_NO_ADJUSTMENT = Adjustment(None, {})
+
+
+def age_band(age_years):
+    """Return the name of the age band an age in years falls into."""
+    if age_years is None:
+        return DEFAULT_AGE_BAND
+    return AGE_BANDS[max(0, bisect_right(_BAND_AGES, age_years) - 1)][1]
+
+
+class PatientLimits:
+    """Age band, standing overrides and clinician adjustments of a patient."""
+    __slots__ = ('band', 'overrides', 'adjustments')
+
+    def __init__(self, band=DEFAULT_AGE_BAND):
+        self.band = band
+        self.overrides = {}
+        self.adjustments = {}
+
+    def layers(self, vital):
+        """Return the limit layers of a vital, weakest first."""
+        return (AGE_BAND_LIMITS[self.band].get(vital, {}),
+                self.overrides.get(vital, {}),
+                self.adjustments.get(vital, _NO_ADJUSTMENT).limits)
+
+
+_DEFAULT_PATIENT = PatientLimits()
+
+
+class LimitResolver:
+    """Resolve (patient, vital) to compiled band edges.
+
+    Effective limits are VITAL_RANGES, then the age band, then the
+    patient's overrides, then clinician adjustments. Compiled edges are
+    cached in insertion order and the older half is dropped when the
+    cache is full, so a hit costs one dict lookup. Changing a patient's
+    limits evicts only that patient, and a rebuilt threshold profile
+    (tolerance, VITAL_RANGES or AGE_BAND_LIMITS change) empties the
+    whole cache.
+    """
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._patients = {}
+        self._cache = {}
+        self._profile = None
+
+    def _patient(self, patient_id):
+        patient = self._patients.get(patient_id)
+        if patient is None:
+            patient = self._patients[patient_id] = PatientLimits()
+        return patient
+
+    def set_age(self, patient_id, age_years):
+        """Place a patient in the age band matching their age."""
+        self._patient(patient_id).band = age_band(age_years)
+        self.invalidate(patient_id)
+
+    def set_override(self, patient_id, vital, **limits):
+        """Set standing patient-specific limits, e.g. min=50 for pulse."""
+        self._patient(patient_id).overrides[vital] = limits
+        self.invalidate(patient_id)
+
+    def adjust(self, patient_id, vital, clinician, **limits):
+        """Record a clinician adjustment, applied over any override."""
+        adjustment = Adjustment(clinician, limits)
+        self._patient(patient_id).adjustments[vital] = adjustment
+        self.invalidate(patient_id)
+
+    def clear(self, patient_id, vital):
+        """Remove the override and adjustment of a patient's vital."""
+        patient = self._patient(patient_id)
+        patient.overrides.pop(vital, None)
+        patient.adjustments.pop(vital, None)
+        self.invalidate(patient_id)
+
+    def discharge(self, patient_id):
+        """Forget everything about a patient."""
+        self._patients.pop(patient_id, None)
+        self.invalidate(patient_id)
+
+    def invalidate(self, patient_id=None):
+        """Evict cached edges of one patient, or of everyone."""
+        if patient_id is None:
+            self._cache.clear()
+            return
+        for vital in VITAL_RANGES:
+            self._cache.pop((patient_id, vital), None)
+
+    def limits(self, patient_id, vital):
+        """Return the effective {'min': ..., 'max': ...} of a vital."""
+        vital_range = VITAL_RANGES[vital]
+        limits = {'min': vital_range['min'], 'max': vital_range['max']}
+        patient = self._patients.get(patient_id, _DEFAULT_PATIENT)
+        for layer in patient.layers(vital):
+            limits.update(layer)
+        return limits
+
+    def _compile(self, key):
+        self.misses += 1
+        limits = self.limits(*key)
+        edges = compile_edges(key[1], limits['min'], limits['max'])
+        if len(self._cache) >= self.capacity:
+            self._evict_oldest()
+        self._cache[key] = edges
+        return edges
+
+    def _evict_oldest(self):
+        """Drop the older half of the cache in one go."""
+        for key in list(islice(self._cache, (len(self._cache) + 1) // 2)):
+            del self._cache[key]
+
+    def _check_profile(self):
+        """Empty the cache when the global threshold profile was rebuilt."""
+        profile = threshold_profile()
+        if profile is not self._profile:
+            self._cache.clear()
+            self._profile = profile
+
+    def edges(self, patient_id, vital):
+        """Return the compiled band edges of a patient's vital."""
+        self._check_profile()
+        key = (patient_id, vital)
+        edges = self._cache.get(key)
+        if edges is None:
+            return self._compile(key)
+        self.hits += 1
+        return edges
+
+    def classify(self, patient_id, vital, value, unit=None):
+        """Return the STATUS_* code of a reading for this patient."""
+        normalized = normalize_vital_value(vital, value, unit)
+        return BAND_STATUS[bisect_right(self.edges(patient_id, vital),
+                                        normalized)]
@@ -0,0 +1,57 @@
+"""Read-only memory-mapped files made of 8-byte aligned sections.
+
+Reading store segments and engine snapshots both pad every section to
+ALIGNMENT bytes when writing, so each section can later be cast in place
+into a typed memoryview of the mapping, without copying.
+"""
+import mmap
+
+ALIGNMENT = 8
+
+
+def padded(size):
+    """Round size up to a multiple of ALIGNMENT."""
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def pad(data):
+    """Return data followed by zeros up to a multiple of ALIGNMENT bytes."""
+    return data.ljust(padded(len(data)), b'\0')
+
+
+class MappedFile:
+    """Read-only mapping of a file that hands out typed views of it.
+
+    close() releases every view before unmapping the file. Use as a
+    context manager, or call close().
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as mapped:
+            self.map = mmap.mmap(mapped.fileno(), 0, access=mmap.ACCESS_READ)
+        self._base = memoryview(self.map)
+        self._views = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.map)
+
+    def view(self, offset, size, typecode):
+        """Return the size bytes at offset cast to typecode."""
+        raw = self._base[offset:offset + size]
+        view = raw.cast(typecode)
+        self._views.extend((view, raw))
+        return view
+
+    def close(self):
+        """Release every view of the mapping and unmap the file."""
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._base.release()
+        self.map.close()
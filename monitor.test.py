@@ -1,5 +1,50 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import unittest.mock
+import urllib.request
+from time import monotonic, sleep
+import monitor
+import instrumentation
 from monitor import *
+from engine import MonitorEngine, Transition, synthetic_feed
+from ingest_server import REPLY_NOT_OK, REPLY_OK, IngestServer
+from device_simulator import run_fleet
+from trends import RollingWindow, TrendMonitor
+from limits import LimitResolver, age_band
+from vital_registry import converters_to
+from reading_store import ReadingStore, Row, Segment
+from bulk_loader import BulkLoader
+from backfill import backfill, score_file
+from batch import classify_batch, classify_column
+try:
+  import numpy
+except ImportError:
+  numpy = None
+from alert_dispatch import (Alert, AlertDispatcher, ConsoleSink, MemorySink,
+                            RateLimitedSink, blink_alert, default_dispatcher,
+                            set_default_dispatcher)
+from alert_state import AlertTracker
+from snapshot import Snapshotter, restore, write_snapshot
+from sharded import (READING_RECORD, SharedRing, ShardedMonitor, jump_hash,
+                     shard_of)
+
+
+def setUpModule():
+  # Alerts raised by the tests are kept in memory rather than blinked on
+  # the console, which the exit hook would otherwise wait for
+  quiet = AlertDispatcher([MemorySink()]).start()
+  unittest.addModuleCleanup(set_default_dispatcher,
+                            set_default_dispatcher(quiet))
+  unittest.addModuleCleanup(quiet.stop)
 
 #We need to reduce the overlapping tests added beacuse of extensions
 
@@ -256,5 +301,904 @@ class MonitorTest(unittest.TestCase):
     self.assertFalse(is_vital_ok('temperature', 94, 'F'))
 
 
+class ThresholdProfileTest(unittest.TestCase):
+  def tearDown(self):
+    set_warning_tolerance(1.5)
+    update_vital_range('pulse', min=60, max=100)
+
+  def test_classify_band_edges_are_inclusive(self):
+    profile = threshold_profile()
+    self.assertEqual(profile.classify('temperature', 95), STATUS_WARNING_LOW)
+    self.assertEqual(profile.classify('temperature', 96.53), STATUS_WARNING_LOW)
+    self.assertEqual(profile.classify('temperature', 98.6), STATUS_OK)
+    self.assertEqual(profile.classify('temperature', 100.47), STATUS_WARNING_HIGH)
+    self.assertEqual(profile.classify('temperature', 102), STATUS_WARNING_HIGH)
+    self.assertEqual(profile.classify('temperature', 94.99), STATUS_CRITICAL)
+    self.assertEqual(profile.classify('temperature', 102.01), STATUS_CRITICAL)
+    self.assertEqual(profile.classify('spo2', 1000), STATUS_OK)
+
+  def test_profile_is_reused_between_readings(self):
+    self.assertIs(threshold_profile(), threshold_profile())
+
+  def test_tolerance_change_rebuilds_profile(self):
+    set_warning_tolerance(10)
+    self.assertEqual(classify_vital('pulse', 91), STATUS_WARNING_HIGH)
+    self.assertEqual(is_in_warning_range('pulse', 69), 'low')
+
+  def test_range_update_rebuilds_profile(self):
+    update_vital_range('pulse', max=120)
+    self.assertTrue(is_vital_ok('pulse', 110))
+    self.assertEqual(classify_vital('pulse', 121), STATUS_CRITICAL)
+
+  def test_direct_range_edit_rebuilds_profile(self):
+    VITAL_RANGES['pulse']['max'] = 120
+    self.assertTrue(is_vital_ok('pulse', 110))
+    self.assertEqual(is_in_warning_range('pulse', 119), 'high')
+    self.assertEqual(calculate_warning_ranges('pulse')['warning_high_range'],
+                     (118.2, 120))
+
+  def test_tolerance_is_read_live_through_monitor(self):
+    set_warning_tolerance(10)
+    self.assertEqual(monitor.WARNING_TOLERANCE_PERCENT, 10)
+
+  def test_tolerance_written_through_monitor(self):
+    monitor.WARNING_TOLERANCE_PERCENT = 10
+    self.assertEqual(classify_vital('pulse', 91), STATUS_WARNING_HIGH)
+    self.assertEqual(is_in_warning_range('pulse', 91), 'high')
+
+
+class PanelTest(unittest.TestCase):
+  def tearDown(self):
+    invalidate_threshold_profile()
+
+  def test_verdict_matches_vitals_ok_without_output(self):
+    panels = ({'temperature': 98.6, 'pulse': 70, 'spo2': 95},
+              {'temperature': {'value': 37, 'unit': 'C'}, 'pulse': 99,
+               'spo2': 91},
+              {'temperature': 98.6, 'pulse': 70, 'spo2': 89},
+              {'temperature': {'value': 40, 'unit': 'C'}, 'pulse': 101})
+    for panel in panels:
+      with contextlib.redirect_stdout(io.StringIO()) as shown:
+        verdict = panel_verdict(panel)
+      self.assertEqual(shown.getvalue(), '')
+      with contextlib.redirect_stdout(io.StringIO()):
+        self.assertEqual(verdict, vitals_ok(panel))
+
+  def test_failed_vital_is_checked_first_next_time(self):
+    panel = {'temperature': 98.6, 'pulse': 70, 'spo2': 89}
+    self.assertFalse(panel_verdict(panel))
+    self.assertEqual(panel_plan(panel).order[0][0], 'spo2')
+
+  def test_reordering_leaves_a_running_verdicts_order_alone(self):
+    panel = {'temperature': 98.6, 'pulse': 70, 'spo2': 89}
+    plan = panel_plan(panel)
+    order = plan.order
+    plan.failed_first(order[-1])
+    self.assertIsInstance(order, tuple)
+    self.assertEqual(plan.order, (order[-1], *order[:-1]))
+
+  def test_report_covers_every_reading(self):
+    report = panel_report({'temperature': {'value': 40, 'unit': 'C'},
+                           'pulse': 99, 'spo2': 95})
+    self.assertFalse(report.ok)
+    self.assertEqual(report.statuses, {'temperature': STATUS_CRITICAL,
+                                       'pulse': STATUS_WARNING_HIGH,
+                                       'spo2': STATUS_OK})
+    self.assertEqual(report.failed(), ('temperature',))
+    self.assertEqual(report.warnings(), ('pulse',))
+
+  def test_report_of_multi_component_vital(self):
+    register_vital('blood_pressure', standard_unit='mmHg',
+                   components={'systolic': {'min': 90, 'max': 140},
+                               'diastolic': {'min': 60, 'max': 90}})
+    self.addCleanup(unregister_vital, 'blood_pressure')
+    report = panel_report({'blood_pressure': {'value': (120, 95)}})
+    self.assertEqual(report.failed(), ('blood_pressure.diastolic',))
+
+  def test_plan_is_built_once_per_schema(self):
+    panel = {'temperature': 98.6, 'pulse': 70}
+    self.assertIs(panel_plan(panel), panel_plan(dict(panel)))
+    self.assertIsNot(panel_plan(panel), panel_plan({'pulse': 70}))
+
+  def test_unknown_vital_is_rejected(self):
+    with self.assertRaises(ValueError):
+      panel_verdict({'pulse': 70, 'glucose': 90})
+
+
+class TemporaryDirectoryMixin:
+  """Give every test a fresh self.directory, removed after the test."""
+  def setUp(self):
+    super().setUp()
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.directory = directory.name
+
+
+def run_script(script):
+  """Run script in a fresh interpreter next to this file; return stdout."""
+  return subprocess.run([sys.executable, '-c', script],
+                        cwd=os.path.dirname(os.path.abspath(__file__)),
+                        capture_output=True, text=True, check=True).stdout
+
+
+class LazyImportTest(unittest.TestCase):
+  def _loaded_after(self, code):
+    script = f"import sys\n{code}\nprint(' '.join(sorted(sys.modules)))"
+    return set(run_script(script).split())
+
+  def test_classifying_does_not_load_alerts(self):
+    loaded = self._loaded_after(
+      "import monitor\nmonitor.classify_vital('pulse', 70)")
+    self.assertNotIn('vitals_report', loaded)
+    self.assertNotIn('alert_dispatch', loaded)
+
+  def test_report_names_load_on_first_use(self):
+    loaded = self._loaded_after("import monitor\nmonitor.alert_message")
+    self.assertIn('alert_dispatch', loaded)
+
+
+class BatchClassifierTest(unittest.TestCase):
+  def test_column_matches_scalar_path_on_boundaries(self):
+    readings = [94.99, 95, 96.0, 96.53, 98.6, 100.47, 101.0, 102, 102.01]
+    statuses = classify_column('temperature', readings)
+    self.assertEqual(list(statuses),
+                     [classify_vital('temperature', v) for v in readings])
+    self.assertEqual(statuses.typecode, 'b')
+
+  def test_column_with_per_row_units(self):
+    statuses = classify_column('temperature', [37.0, 98.6, 34.0],
+                               units=['C', 'F', 'C'])
+    self.assertEqual(list(statuses), [STATUS_OK, STATUS_OK, STATUS_CRITICAL])
+
+  @unittest.skipUnless(numpy, 'needs NumPy')
+  def test_vectorized_and_scalar_columns_agree(self):
+    values = [37.0, 98.6, 310.0, 34.0, 102.01, 95]
+    units = ['C', 'F', 'K', 'c', None, 'F']
+    vectorized = classify_column('temperature', values, units=units)
+    with unittest.mock.patch('batch.numpy', None):
+      scalar = classify_column('temperature', values, units=units)
+    self.assertEqual(vectorized, scalar)
+    self.assertEqual(list(scalar),
+                     [classify_vital('temperature', v, u)
+                      for v, u in zip(values, units)])
+
+  def test_batch_verdicts_match_vitals_ok(self):
+    columns = {'temperature': [98.6, 96.0, 94.0],
+               'pulse': [70, 70, 70],
+               'spo2': [95, 91, 95]}
+    statuses, verdicts = classify_batch(columns)
+    self.assertEqual(list(verdicts), [1, 1, 0])
+    self.assertEqual(list(statuses['spo2']), [STATUS_OK, STATUS_WARNING_LOW,
+                                              STATUS_OK])
+
+  @unittest.skipUnless(numpy, 'needs NumPy')
+  def test_vectorized_and_scalar_verdicts_agree(self):
+    columns = {'temperature': numpy.array([98.6, 103.0, 94.0, 98.0]),
+               'pulse': numpy.array([70, 70, 101, 99])}
+    _, vectorized = classify_batch(columns)
+    with unittest.mock.patch('batch.numpy', None):
+      _, scalar = classify_batch(columns)
+    self.assertEqual(vectorized, scalar)
+    self.assertEqual(list(scalar), [1, 0, 0, 1])
+    self.assertEqual(list(classify_batch({})[1]), [])
+
+  def test_batch_rejects_ragged_columns(self):
+    with self.assertRaises(ValueError):
+      classify_batch({'pulse': [70, 80], 'spo2': [95]})
+
+
+class MonitorEngineTest(unittest.TestCase):
+  def test_only_status_changes_are_emitted(self):
+    events = [('bed-1', 0, 'pulse', 70, None),
+              ('bed-1', 1, 'pulse', 72, None),
+              ('bed-1', 2, 'pulse', 99, None),
+              ('bed-2', 2, 'pulse', 70, None),
+              ('bed-1', 3, 'pulse', 105, None)]
+    transitions = list(MonitorEngine().ingest(events))
+    self.assertEqual(transitions, [
+        Transition('bed-1', 0, 'pulse', None, STATUS_OK, 70),
+        Transition('bed-1', 2, 'pulse', STATUS_OK, STATUS_WARNING_HIGH, 99),
+        Transition('bed-2', 2, 'pulse', None, STATUS_OK, 70),
+        Transition('bed-1', 3, 'pulse', STATUS_WARNING_HIGH, STATUS_CRITICAL,
+                   105)])
+
+  def test_latest_status_per_patient(self):
+    engine = MonitorEngine()
+    engine.observe('bed-1', 0, 'temperature', 34.0, 'C')
+    self.assertEqual(engine.status('bed-1', 'temperature'), STATUS_CRITICAL)
+    self.assertIsNone(engine.status('bed-1', 'spo2'))
+    self.assertIsNone(engine.status('bed-9', 'spo2'))
+
+  def test_vital_registered_after_engine_start(self):
+    engine = MonitorEngine(alerts=AlertTracker())
+    engine.observe('bed-1', 0, 'pulse', 70)
+    register_vital('etco2', min=35, max=45, standard_unit='mmHg',
+                   alert='EtCO2 out of range!')
+    self.addCleanup(unregister_vital, 'etco2')
+    self.assertIsNone(engine.status('bed-1', 'etco2'))
+    transition = engine.observe('bed-1', 1, 'etco2', 50)
+    self.assertEqual(transition.status, STATUS_CRITICAL)
+    self.assertEqual(engine.status('bed-1', 'etco2'), STATUS_CRITICAL)
+    self.assertEqual(engine.status('bed-1', 'pulse'), STATUS_OK)
+
+  def test_synthetic_feed_is_replayable(self):
+    first = list(synthetic_feed(5, rate_hz=2, duration=3, seed=7))
+    self.assertEqual(first, list(synthetic_feed(5, rate_hz=2, duration=3,
+                                                seed=7)))
+    self.assertEqual(len(first), 5 * 6 * 3)
+
+
+class AlertTrackerTest(unittest.TestCase):
+  def test_flapping_pulse_settles_after_dwell(self):
+    engine = MonitorEngine(alerts=AlertTracker())
+    values = [70, 101, 99.5, 101, 99.5, 101] + [90] * 12
+    events = [('bed-1', t, 'pulse', v, None) for t, v in enumerate(values)]
+    transitions = [(t.timestamp, t.status) for t in engine.ingest(events)]
+    self.assertEqual(transitions, [(0, STATUS_OK), (1, STATUS_CRITICAL),
+                                   (16, STATUS_OK)])
+
+  def test_token_bucket_drops_bursts(self):
+    now = [0.0]
+    sink = MemorySink()
+    limited = RateLimitedSink(sink, rate=1, burst=2, clock=lambda: now[0])
+    for message in 'abc':
+      limited.deliver(Alert(message, 0))
+    now[0] = 1.0
+    limited.deliver(Alert('d', 1))
+    self.assertEqual(sink.messages, ['a', 'b', 'd'])
+    self.assertEqual(limited.suppressed, 1)
+
+
+class SnapshotTest(TemporaryDirectoryMixin, unittest.TestCase):
+  def setUp(self):
+    super().setUp()
+    self.path = os.path.join(self.directory, 'engine.snap')
+
+  def tearDown(self):
+    update_vital_range('pulse', min=60, max=100)
+
+  def test_restored_engine_does_not_realert(self):
+    engine = MonitorEngine()
+    list(engine.ingest([('bed-1', 0, 'pulse', 105, None),
+                        (7, 0, 'spo2', 95, None)]))
+    self.assertEqual(write_snapshot(engine, self.path), 2)
+    restored = restore(self.path)
+    self.assertEqual(len(restored), 2)
+    self.assertEqual(restored.readings, 2)
+    self.assertEqual(restored.status('bed-1', 'pulse'), STATUS_CRITICAL)
+    self.assertIsNone(restored.observe('bed-1', 1, 'pulse', 106))
+    self.assertEqual(restored.observe(7, 1, 'spo2', 85).previous, STATUS_OK)
+
+  def test_pending_alerts_keep_their_dwell(self):
+    engine = MonitorEngine(alerts=AlertTracker())
+    values = [70, 101, 90, 90]
+    list(engine.ingest(('bed-1', t, 'pulse', v, None)
+                       for t, v in enumerate(values)))
+    write_snapshot(engine, self.path)
+    restored = restore(self.path)
+    self.assertIsNone(restored.observe('bed-1', 10, 'pulse', 90))
+    transition = restored.observe('bed-1', 12, 'pulse', 90)
+    self.assertEqual(transition.status, STATUS_OK)
+
+  def test_stale_snapshot_is_rejected(self):
+    engine = MonitorEngine()
+    engine.observe('bed-1', 0, 'pulse', 70)
+    write_snapshot(engine, self.path)
+    update_vital_range('pulse', max=120)
+    with self.assertRaises(ValueError):
+      restore(self.path)
+
+  def test_snapshot_under_other_alerting_policy_is_rejected(self):
+    engine = MonitorEngine(alerts=AlertTracker())
+    engine.observe('bed-1', 0, 'pulse', 101)
+    write_snapshot(engine, self.path)
+    with unittest.mock.patch.dict(VITAL_ALERTING['pulse'], dwell_seconds=60):
+      with self.assertRaises(ValueError):
+        restore(self.path)
+
+  def test_snapshot_under_other_vital_ids_is_rejected(self):
+    engine = MonitorEngine()
+    engine.observe('bed-1', 0, 'pulse', 70)
+    write_snapshot(engine, self.path)
+    names = reversed(list(VITALS.ids))
+    reordered = {name: vital_id for vital_id, name in enumerate(names)}
+    with unittest.mock.patch.object(VITALS, 'ids', reordered):
+      with self.assertRaises(ValueError):
+        restore(self.path)
+
+  def test_snapshotter_writes_while_ingesting(self):
+    engine = MonitorEngine()
+    snapshotter = Snapshotter(engine, self.path, interval=0.001).start()
+    list(engine.ingest(synthetic_feed(50, duration=5)))
+    snapshotter.stop()
+    self.assertGreaterEqual(snapshotter.written, 1)
+    self.assertFalse(snapshotter.snapshot())
+    restored = restore(self.path)
+    self.assertEqual(restored.readings, engine.readings)
+    self.assertEqual(restored.patient_states(), [
+      (patient, bytes(state)) for patient, state in engine.patient_states()])
+
+
+class ShardedMonitorTest(unittest.TestCase):
+  def test_merged_stream_matches_single_engine(self):
+    feed = list(synthetic_feed(40, rate_hz=2, duration=10, seed=3))
+    expected = list(MonitorEngine(alerts=AlertTracker()).ingest(feed))
+    with ShardedMonitor(shards=3, alerts=True, slots=64) as sharded:
+      self.assertEqual(list(sharded.ingest(feed)), expected)
+
+  def test_patient_keeps_its_shard(self):
+    self.assertEqual(shard_of('bed-4', 8), shard_of('bed-4', 8))
+    keys = range(1000)
+    before = list(map(jump_hash, keys, [4] * len(keys)))
+    after = list(map(jump_hash, keys, [5] * len(keys)))
+    stayed = sum(map(int.__eq__, before, after))
+    # Only keys moving to the new shard 4 change shard
+    self.assertEqual(after.count(4), len(keys) - stayed)
+    self.assertLess(after.count(4), 300)
+
+  def test_readings_are_handed_over_without_a_full_batch(self):
+    with ShardedMonitor(shards=1) as sharded:
+      for second, value in enumerate([150, 70, 150]):
+        sharded.submit('bed-1', second, 'pulse', value)
+        self.assertEqual([t.value for t in self._ready_soon(sharded)], [value])
+
+  @staticmethod
+  def _ready_soon(sharded, seconds=5):
+    deadline = monotonic() + seconds
+    while not (ready := sharded.ready()) and monotonic() < deadline:
+      sleep(0.001)
+    return ready
+
+  def test_ring_is_exactly_its_slots(self):
+    ring = SharedRing(READING_RECORD, 3)
+    self.addCleanup(ring.close, unlink=True)
+    self.assertEqual(len(ring.data), 3 * READING_RECORD.size)
+
+  def test_stop_without_start(self):
+    self.assertEqual(ShardedMonitor(shards=1).stop(), [])
+
+  def test_unknown_vital_is_rejected_before_handover(self):
+    sharded = ShardedMonitor(shards=1)
+    with self.assertRaises(ValueError):
+      sharded.submit('bed-1', 0, 'glucose', 90)
+    with self.assertRaises(ValueError):
+      sharded.submit('bed-1', 0, 'temperature', 37, 'X')
+
+
+class IngestServerTest(unittest.IsolatedAsyncioTestCase):
+  def test_line_in_both_vital_shapes(self):
+    server = IngestServer()
+    line = (b'{"patient_id": "bed-1", "timestamp": 0, "vitals": '
+            b'{"temperature": {"value": 37, "unit": "C"}, "pulse": 70}}\n')
+    self.assertEqual(server.evaluate_line(line), REPLY_OK)
+    critical = b'{"patient_id": "bed-1", "vitals": {"spo2": 80}}'
+    self.assertEqual(server.evaluate_line(critical), REPLY_NOT_OK)
+
+  def test_malformed_lines_are_rejected_not_raised(self):
+    server = IngestServer()
+    self.assertIn(b'error', server.evaluate_line(b'not json'))
+    self.assertIn(b'error', server.evaluate_line(b'{"vitals": {"bp": 1}}'))
+    self.assertEqual(server.rejected, 2)
+
+  def test_panel_with_unknown_vital_records_nothing(self):
+    transitions = []
+    server = IngestServer(on_transition=transitions.append)
+    line = b'{"patient_id": "bed-1", "vitals": {"pulse": 150, "bogus": 1}}'
+    self.assertIn(b'Unknown vital: bogus', server.evaluate_line(line))
+    self.assertIsNone(server.engine.status('bed-1', 'pulse'))
+    self.assertEqual(transitions, [])
+
+  async def test_concurrent_devices_get_every_reply(self):
+    server = IngestServer(queue_size=8)
+    listener = await server.start_tcp()
+    port = listener.sockets[0].getsockname()[1]
+    connect = functools.partial(asyncio.open_connection, '127.0.0.1', port)
+    latencies = await run_fleet(connect, devices=20, count=25)
+    await server.close()
+    self.assertEqual(len(latencies), 500)
+    self.assertEqual(server.evaluated, 500)
+    self.assertEqual(len(server.engine), 20)
+
+  async def _connect(self, server):
+    listener = await server.start_tcp()
+    self.addAsyncCleanup(server.close)
+    port = listener.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    self.addAsyncCleanup(self._disconnect, writer)
+    return reader, writer
+
+  @staticmethod
+  async def _disconnect(writer):
+    writer.close()
+    with contextlib.suppress(ConnectionError):
+      await writer.wait_closed()
+
+  async def _exchange(self, server, *lines):
+    reader, writer = await self._connect(server)
+    writer.writelines(lines)
+    await writer.drain()
+    replies = [await reader.readline() for _ in lines]
+    writer.close()
+    await server.close()
+    return replies
+
+  async def test_failing_callback_does_not_stop_evaluation(self):
+    def explode(transition):
+      raise RuntimeError('pager down')
+    server = IngestServer(on_transition=explode)
+    line = b'{"patient_id": "bed-1", "vitals": {"spo2": 80}}\n'
+    with self.assertLogs('ingest_server', 'ERROR'):
+      replies = await self._exchange(server, line, line)
+    self.assertEqual(replies, [REPLY_NOT_OK, REPLY_NOT_OK])
+
+  async def test_overlong_line_is_answered_and_closed(self):
+    server = IngestServer()
+    reader, writer = await self._connect(server)
+    writer.write(b'x' * 100000 + b'\n')
+    await writer.drain()
+    self.assertIn(b'error', await reader.readline())
+    self.assertEqual(await reader.read(), b'')
+    writer.close()
+    await server.close()
+    self.assertEqual(server.rejected, 1)
+
+
+class TrendTest(unittest.TestCase):
+  def test_window_statistics(self):
+    window = RollingWindow(capacity=4)
+    for second, value in enumerate([70, 72, 74, 76, 78]):
+      window.append(second * 30, value)
+    self.assertEqual(len(window), 4)
+    self.assertEqual(window.mean(), 75)
+    self.assertEqual(window.variance(), 5)
+    self.assertAlmostEqual(window.slope() * 60, 4)
+    self.assertEqual((window.min(), window.max()), (72, 78))
+    self.assertEqual(window.span, 90)
+
+  def test_window_drops_samples_older_than_max_age(self):
+    window = RollingWindow(capacity=100, max_age=60)
+    window.append(0, 90)
+    window.append(30, 80)
+    window.append(100, 85)
+    self.assertEqual(len(window), 1)
+    self.assertEqual(window.max(), 85)
+
+  def test_drifting_pulse_raises_rapid_rise_before_warning_range(self):
+    readings = [('bed-1', second, 'pulse', 70 + second * 28 / 120, None)
+                for second in range(0, 121, 5)]
+    alerts = list(TrendMonitor().ingest(readings))
+    self.assertTrue(alerts)
+    self.assertEqual({alert.kind for alert in alerts}, {'rapid_rise'})
+    self.assertLess(alerts[0].timestamp, 120)
+
+  def test_sustained_near_limit(self):
+    trends = TrendMonitor()
+    for second in range(0, 121, 10):
+      alerts = trends.observe('bed-1', second, 'spo2', 91)
+    self.assertEqual([alert.kind for alert in alerts],
+                     ['sustained_near_limit'])
+
+  def test_sustained_near_limit_at_bedside_rate(self):
+    readings = [('bed-1', tick / 4, 'spo2', 91, None) for tick in range(520)]
+    kinds = {alert.kind for alert in TrendMonitor().ingest(readings)}
+    self.assertEqual(kinds, {'sustained_near_limit'})
+
+  def test_near_limit_counts_from_the_start_of_the_run(self):
+    values = [97] * 20 + [91] * 40
+    readings = [('bed-1', second, 'spo2', value, None)
+                for second, value in zip(range(0, 600, 10), values)]
+    alerts = list(TrendMonitor().ingest(readings))
+    self.assertEqual([(alert.timestamp, alert.kind) for alert in alerts],
+                     [(320, 'sustained_near_limit')])
+
+  def test_alert_is_raised_again_after_the_check_passes(self):
+    trends = TrendMonitor()
+    values = [91] * 13 + [97] + [91] * 13
+    alerts = [alert.timestamp for second, value in enumerate(values)
+              for alert in trends.observe('bed-1', second * 10, 'spo2', value)]
+    self.assertEqual(alerts, [120, 260])
+
+  def test_forget_drops_only_that_patient(self):
+    trends = TrendMonitor()
+    trends.observe('bed-1', 0, 'pulse', 70)
+    kept = trends.window('bed-2', 'pulse')
+    trends.forget('bed-1')
+    self.assertEqual(len(trends.window('bed-1', 'pulse')), 0)
+    self.assertIs(trends.window('bed-2', 'pulse'), kept)
+
+  def test_critical_values_are_not_near_limit(self):
+    readings = [('bed-1', tick / 4, 'pulse', 150, None) for tick in range(520)]
+    self.assertEqual(list(TrendMonitor().ingest(readings)), [])
+
+  def test_vitals_without_rules_are_ignored(self):
+    self.assertEqual(TrendMonitor(rules={}).observe('bed-1', 0, 'pulse', 70),
+                     [])
+
+
+class LimitResolverTest(unittest.TestCase):
+  def test_age_bands(self):
+    self.assertEqual(age_band(0.2), 'infant')
+    self.assertEqual(age_band(1), 'child')
+    self.assertEqual(age_band(17.9), 'adolescent')
+    self.assertEqual(age_band(None), 'adult')
+
+  def test_unknown_patient_uses_vital_ranges(self):
+    resolver = LimitResolver()
+    self.assertEqual(resolver.edges('bed-1', 'pulse'),
+                     threshold_profile().edges['pulse'])
+
+  def test_layers_apply_in_order(self):
+    resolver = LimitResolver()
+    resolver.set_age('bed-1', 0.5)
+    self.assertEqual(resolver.classify('bed-1', 'pulse', 140), STATUS_OK)
+    resolver.set_override('bed-1', 'pulse', max=130)
+    self.assertEqual(resolver.classify('bed-1', 'pulse', 140), STATUS_CRITICAL)
+    resolver.adjust('bed-1', 'pulse', 'dr-lee', max=150)
+    self.assertEqual(resolver.limits('bed-1', 'pulse'),
+                     {'min': 100, 'max': 150})
+    resolver.clear('bed-1', 'pulse')
+    self.assertEqual(resolver.limits('bed-1', 'pulse'),
+                     {'min': 100, 'max': 160})
+
+  def test_cache_hits_and_bulk_eviction(self):
+    resolver = LimitResolver(capacity=4)
+    for patient in ('bed-1', 'bed-1', 'bed-2', 'bed-3', 'bed-4', 'bed-5'):
+      resolver.edges(patient, 'pulse')
+    self.assertEqual(len(resolver._cache), 3)
+    resolver.edges('bed-1', 'pulse')
+    resolver.edges('bed-5', 'pulse')
+    self.assertEqual((resolver.hits, resolver.misses), (2, 6))
+
+  def test_age_band_edit_empties_cache(self):
+    resolver = LimitResolver()
+    resolver.set_age('bed-1', 5)
+    self.assertEqual(resolver.classify('bed-1', 'pulse', 125), STATUS_CRITICAL)
+    child = AGE_BAND_LIMITS['child']['pulse']
+    self.addCleanup(child.__setitem__, 'max', child['max'])
+    child['max'] = 130
+    self.assertEqual(resolver.classify('bed-1', 'pulse', 125), STATUS_OK)
+
+  def test_tolerance_change_empties_cache(self):
+    resolver = LimitResolver()
+    resolver.edges('bed-1', 'pulse')
+    set_warning_tolerance(10)
+    self.addCleanup(set_warning_tolerance, 1.5)
+    self.assertEqual(resolver.classify('bed-1', 'pulse', 91),
+                     STATUS_WARNING_HIGH)
+
+
+class VitalRegistryTest(unittest.TestCase):
+  def test_kelvin_goes_through_celsius_in_one_step(self):
+    to_fahrenheit = converters_to('F')
+    self.assertAlmostEqual(to_fahrenheit['K'](310.15), 98.6, places=6)
+    self.assertAlmostEqual(normalize_vital_value('temperature', 310.15, 'k'),
+                           98.6, places=6)
+    self.assertIn('k', VITALS.spec('temperature').converters)
+
+  def test_unsupported_unit_raises(self):
+    with self.assertRaises(ValueError):
+      normalize_vital_value('temperature', 37, 'X')
+    with self.assertRaises(ValueError):
+      normalize_vital_value('pulse', 70, 'mmHg')
+
+  def test_register_vital_with_units(self):
+    register_vital('glucose', min=70, max=180, standard_unit='mg/dL',
+                   units=('mg/dL', 'mmol/L'), display='{value} {unit}',
+                   alert='Glucose critical!',
+                   warning_low='Warning: Approaching hypoglycemia',
+                   warning_high='Warning: Approaching hyperglycemia')
+    self.addCleanup(unregister_vital, 'glucose')
+    self.assertTrue(is_vital_ok('glucose', 5.5, 'mmol/L'))
+    self.assertFalse(is_vital_ok('glucose', 2.5, 'MMOL/L'))
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+      self.assertEqual(check_vital_with_warning('glucose', 3.9, 'MMOL/L'),
+                       'warning')
+    self.assertIn('(Value: 3.9 mmol/L)', output.getvalue())
+
+  def test_multi_component_vital(self):
+    limits = {'alert': 'Blood pressure critical!',
+              'warning_low': 'Warning: Approaching hypotension',
+              'warning_high': 'Warning: Approaching hypertension'}
+    register_vital('blood_pressure', standard_unit='mmHg',
+                   units=('mmHg', 'kPa'),
+                   components={'systolic': dict(limits, min=90, max=140),
+                               'diastolic': dict(limits, min=60, max=90)})
+    self.addCleanup(unregister_vital, 'blood_pressure')
+    self.assertTrue(vitals_ok({'blood_pressure': (120, 80), 'pulse': 70}))
+    self.assertTrue(vitals_ok(
+        {'blood_pressure': {'value': (16, 10.6), 'unit': 'kPa'}}))
+    self.assertEqual(classify_vital('blood_pressure.diastolic', 95),
+                     STATUS_CRITICAL)
+    self.assertNotIn('blood_pressure', VITAL_RANGES)
+
+  def test_unknown_vital_gets_no_id(self):
+    known = dict(VITALS.ids)
+    with self.assertRaises(KeyError):
+      VITALS.spec('junk0')
+    self.assertEqual(VITALS.ids, known)
+
+  def test_vital_without_standard_unit_is_rejected(self):
+    with self.assertRaises(ValueError):
+      register_vital('lactate', min=1, max=2)
+    self.assertNotIn('lactate', VITAL_RANGES)
+
+
+class ReadingStoreTest(TemporaryDirectoryMixin, unittest.TestCase):
+  def setUp(self):
+    super().setUp()
+    self.path = os.path.join(self.directory, 'readings.seg')
+
+  def _fill(self, store):
+    store.append('bed-1', 10.0, 'pulse', 70)
+    store.append('bed-2', 11.0, 'temperature', 34.0, 'C')
+    store.append('bed-1', 12.0, 'pulse', 99)
+
+  def test_scan_in_memory(self):
+    store = ReadingStore()
+    self._fill(store)
+    self.assertEqual(list(store.scan('bed-1', start=11)),
+                     [Row(12.0, 'bed-1', 'pulse', 99.0, STATUS_WARNING_HIGH)])
+    self.assertEqual(len(list(store.scan())), 3)
+
+  def test_segment_blocks_replay_from_mmap(self):
+    store = ReadingStore(self.path)
+    self._fill(store)
+    self.assertEqual(store.flush(), 3)
+    store = ReadingStore(self.path)
+    store.append('bed-3', 20.0, 'spo2', 91)
+    store.flush()
+    with Segment(self.path) as segment:
+      self.assertEqual((len(segment), len(segment.blocks)), (4, 2))
+      self.assertEqual([row.vital for row in segment.scan('bed-1')],
+                       ['pulse', 'pulse'])
+      self.assertEqual(list(segment.scan(start=15)),
+                       [Row(20.0, 'bed-3', 'spo2', 91.0, STATUS_WARNING_LOW)])
+      self.assertEqual(list(segment.scan('nobody')), [])
+      statuses = [list(block) for block in segment.reclassify()]
+    self.assertEqual(statuses, [[STATUS_OK, STATUS_CRITICAL,
+                                 STATUS_WARNING_HIGH], [STATUS_WARNING_LOW]])
+
+  def test_replay_uses_current_limits(self):
+    store = ReadingStore(self.path)
+    self._fill(store)
+    store.flush()
+    set_warning_tolerance(10)
+    self.addCleanup(set_warning_tolerance, 1.5)
+    with Segment(self.path) as segment:
+      self.assertEqual(list(next(segment.reclassify())),
+                       [STATUS_WARNING_LOW, STATUS_CRITICAL,
+                        STATUS_WARNING_HIGH])
+
+
+class BulkLoaderTest(TemporaryDirectoryMixin, unittest.TestCase):
+  def _load(self, name, content, chunk_size=16):
+    path = os.path.join(self.directory, name)
+    with open(path, 'wb') as export:
+      export.write(content)
+    self.rejects = io.BytesIO()
+    self.loader = BulkLoader(self.rejects, batch_size=2,
+                             chunk_size=chunk_size)
+    batches = list(self.loader.load(path))
+    return [(list(batch.values), list(self.loader.classify(batch)))
+            for batch in batches]
+
+  def test_ndjson_batches_are_normalized_and_classified(self):
+    batches = self._load('day.ndjson', b'\n'.join([
+        b'{"patient_id": "bed-2", "timestamp": 5, "vitals": '
+        b'{"temperature": {"value": 34, "unit": "C"}, "spo2": 91}}',
+        b'not json',
+        b'{"patient_id": "bed-3", "timestamp": 6, "vitals": {"pulse": 70}}']))
+    self.assertEqual(batches, [([93.2, 91.0], [STATUS_CRITICAL,
+                                               STATUS_WARNING_LOW]),
+                               ([70.0], [STATUS_OK])])
+    self.assertEqual(self.loader.names.vitals,
+                     ['temperature', 'spo2', 'pulse'])
+    self.assertEqual(self.rejects.getvalue(), b'not json\n')
+
+  def test_csv_columns_by_header_and_rejects(self):
+    batches = self._load('day.csv', b'timestamp,patient_id,vital,value,unit'
+                         b'\r\n1,bed-1,pulse,105,\r\n'
+                         b'2,bed-1,temperature,37,X\r\n'
+                         b'3,"bed,9",spo2,85,\n')
+    self.assertEqual(batches, [([105.0, 85.0], [STATUS_CRITICAL] * 2)])
+    self.assertEqual(self.loader.names.patients, ['bed-1', 'bed,9'])
+    self.assertEqual(self.rejects.getvalue(), b'2,bed-1,temperature,37,X\n')
+
+  def test_undecodable_short_and_long_rows_are_rejected(self):
+    batches = self._load('day.csv', b'timestamp,patient_id,vital,value,unit\n'
+                         b'1,bed-\xff,pulse,70,\n'
+                         b'2,bed-1,pulse,70,,105\n'
+                         b'3,bed-1,pulse,70\n'
+                         b'4,bed-1,spo2,85,\n', chunk_size=1024)
+    self.assertEqual(batches, [([85.0], [STATUS_CRITICAL])])
+    self.assertEqual(self.loader.rejected, 3)
+    self.assertNotIn(b'\xef\xbf\xbd', self.rejects.getvalue())
+
+  def test_row_with_an_extra_field_is_rejected_next_to_quotes(self):
+    batches = self._load('day.csv', b'timestamp,patient_id,vital,value,unit\n'
+                         b'1,bed-1,pulse,70,,105\n'
+                         b'2,"bed,9",spo2,85,\n', chunk_size=1024)
+    self.assertEqual(batches, [([85.0], [STATUS_CRITICAL])])
+    self.assertEqual(self.rejects.getvalue(), b'1,bed-1,pulse,70,,105\n')
+
+
+class BackfillTest(TemporaryDirectoryMixin, unittest.TestCase):
+  def setUp(self):
+    super().setUp()
+    self.segment = os.path.join(self.directory, 'day.seg')
+    store = ReadingStore(self.segment)
+    store.append('bed-1', 10.0, 'pulse', 70)
+    store.append('bed-1', 20.0, 'pulse', 105)
+    store.append('bed-1', 30.0, 'pulse', 40)
+    store.flush()
+    self.ndjson = os.path.join(self.directory, 'day.ndjson')
+    with open(self.ndjson, 'w') as archive:
+      archive.write('{"patient_id": "bed-2", "timestamp": 5, "vitals": '
+                    '{"temperature": {"value": 34, "unit": "C"}, '
+                    '"spo2": 91}}\n\nnot json\n')
+
+  def test_segment_summary(self):
+    summary = score_file(self.segment)
+    self.assertEqual(summary.counts, {'pulse': [1, 0, 0, 2]})
+    self.assertEqual(summary.critical, {'bed-1': [20.0, 30.0]})
+
+  def test_ndjson_summary_counts_rejects(self):
+    summary = score_file(self.ndjson)
+    self.assertEqual(summary.counts, {'temperature': [0, 0, 0, 1],
+                                      'spo2': [0, 1, 0, 0]})
+    self.assertEqual(summary.rejected, 1)
+
+  def test_pool_merges_shards_under_proposed_limits(self):
+    summary = backfill([self.segment, self.ndjson], workers=2,
+                       limits={'pulse': {'min': 30, 'max': 106}})
+    result = summary.as_dict()
+    self.assertEqual(result['readings'], 5)
+    self.assertEqual(result['counts']['pulse'],
+                     {'ok': 2, 'warning_low': 0, 'warning_high': 1,
+                      'critical': 0})
+    self.assertEqual(result['critical'], {'bed-2': {'first': 5, 'last': 5}})
+    self.assertEqual(VITAL_RANGES['pulse']['max'], 100)
+
+
+class InstrumentationTest(unittest.TestCase):
+  def setUp(self):
+    self.metrics = instrumentation.enable()
+    self.addCleanup(instrumentation.disable)
+    previous = set_default_dispatcher(AlertDispatcher([MemorySink()]))
+    self.addCleanup(set_default_dispatcher, previous)
+
+  def test_counts_statuses_and_restores_originals(self):
+    self.assertTrue(monitor.is_vital_ok('pulse', 70))
+    with contextlib.redirect_stdout(io.StringIO()):
+      monitor.vitals_ok({'pulse': 105, 'temperature': {'value': 37,
+                                                       'unit': 'C'}})
+    text = self.metrics.render()
+    self.assertIn('monitor_readings_total{vital="pulse",status="ok"} 1', text)
+    self.assertIn('monitor_readings_total{vital="pulse",status="critical"} 1',
+                  text)
+    self.assertIn('monitor_call_seconds_count{function="is_vital_ok",'
+                  'vital="pulse"} 1', text)
+    self.assertIn('monitor_output_seconds_count{output="alert_message"} 1',
+                  text)
+    instrumentation.disable()
+    self.assertIs(monitor.is_vital_ok, is_vital_ok)
+
+  def test_measures_engine_and_ingest(self):
+    server = IngestServer()
+    server.evaluate_line(b'{"patient_id": "bed-1", "vitals": {"pulse": 150}}')
+    text = self.metrics.render()
+    self.assertIn('monitor_readings_total{vital="pulse",status="critical"} 1',
+                  text)
+    self.assertIn('monitor_call_seconds_count{function="MonitorEngine.observe",'
+                  'vital="pulse"} 1', text)
+    self.assertIn('monitor_panel_seconds_count{function="IngestServer.evaluate"}'
+                  ' 1', text)
+    instrumentation.disable()
+    self.assertFalse(hasattr(MonitorEngine.observe, '__wrapped__'))
+
+  def _serve(self):
+    server = instrumentation.serve(self.metrics, port=0)
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+  def test_serves_metrics_and_profile(self):
+    monitor.classify_vital('spo2', 85)
+    base = self._serve()
+    with urllib.request.urlopen(f"{base}/metrics") as reply:
+      self.assertIn(b'status="critical"} 1', reply.read())
+    with urllib.request.urlopen(f"{base}/profile?seconds=0.05") as reply:
+      self.assertIn(b'serve_forever', reply.read())
+
+  def test_bad_profile_seconds_are_rejected(self):
+    base = self._serve()
+    for seconds in ('abc', '-1', 'nan'):
+      with self.assertRaises(urllib.error.HTTPError) as raised:
+        urllib.request.urlopen(f"{base}/profile?seconds={seconds}")
+      raised.exception.close()
+      self.assertEqual(raised.exception.code, 400)
+
+
+class AlertDispatchTest(unittest.TestCase):
+  def setUp(self):
+    self.sink = MemorySink()
+    self.dispatcher = AlertDispatcher([self.sink]).start()
+    self.previous = set_default_dispatcher(self.dispatcher)
+
+  def tearDown(self):
+    set_default_dispatcher(self.previous)
+    self.dispatcher.stop()
+
+  def test_critical_returns_without_waiting_for_alert(self):
+    self.assertEqual(check_vital_with_warning('pulse', 105.0), 'critical')
+    self.dispatcher.flush()
+    self.assertEqual(self.sink.messages,
+                     ['Pulse Rate is out of range! (Value: 105.0)'])
+    self.assertEqual(len(self.dispatcher.latencies), 1)
+
+  def test_full_queue_drops_instead_of_blocking(self):
+    idle = AlertDispatcher([MemorySink()], maxsize=1)
+    self.assertTrue(idle.submit('first'))
+    self.assertFalse(idle.submit('second'))
+    self.assertEqual(idle.dropped, 1)
+
+  def test_failing_sink_does_not_stop_delivery(self):
+    broken = AlertDispatcher([ConsoleSink(stream=object()), self.sink])
+    with self.assertLogs('alert_dispatch', 'ERROR'):
+      broken.start().submit('still delivered')
+      broken.stop()
+    self.assertEqual(self.sink.messages, ['still delivered'])
+
+  def test_slow_sink_does_not_delay_others(self):
+    delivered, release = threading.Event(), threading.Event()
+    dispatcher = AlertDispatcher([
+      unittest.mock.Mock(deliver=lambda alert: release.wait()),
+      unittest.mock.Mock(deliver=lambda alert: delivered.set())]).start()
+    self.addCleanup(dispatcher.stop)
+    self.addCleanup(release.set)
+    dispatcher.submit('paged at once')
+    self.assertTrue(delivered.wait(5))
+
+  def test_queued_alerts_are_delivered_at_exit(self):
+    output = run_script(
+      "import alert_dispatch, monitor\n"
+      "alert_dispatch.set_default_dispatcher(alert_dispatch.AlertDispatcher("
+      "[alert_dispatch.ConsoleSink(pause=0)]).start())\n"
+      "monitor.vitals_ok({'pulse': 150})")
+    self.assertIn('Pulse Rate is out of range! (Value: 150)', output)
+
+  def test_stop_gives_up_on_a_full_queue(self):
+    delivering, release = threading.Event(), threading.Event()
+    stuck = AlertDispatcher([unittest.mock.Mock(
+      deliver=lambda alert: delivering.set() or release.wait())], maxsize=1)
+    self.addCleanup(stuck.stop)
+    self.addCleanup(release.set)
+    stuck.start().submit('delivering')
+    delivering.wait()
+    self.assertTrue(stuck.submit('queued'))
+    started = monotonic()
+    stuck.stop(timeout=0.05)
+    self.assertLess(monotonic() - started, 1)
+
+  def test_latency_includes_delivery(self):
+    slow = AlertDispatcher([ConsoleSink(io.StringIO(), pause=0.01)]).start()
+    slow.submit('blinks for 0.12s')
+    slow.stop()
+    self.assertGreaterEqual(slow.latencies[0], 0.1)
+
+  def test_default_dispatcher_is_created_once(self):
+    set_default_dispatcher(None)
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+      created = set(pool.map(lambda _: default_dispatcher(), range(8)))
+    self.assertEqual(len(created), 1)
+    created.pop().stop()
+
+  def test_blink_alert_animation(self):
+    stream = io.StringIO()
+    blink_alert('Temperature critical!', stream, pause=0)
+    self.assertTrue(stream.getvalue().startswith('Temperature critical!\n'))
+    self.assertEqual(stream.getvalue().count('\r* '), 6)
+
+
 if __name__ == '__main__':
   unittest.main()
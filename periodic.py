@@ -0,0 +1,40 @@
+"""Background threads that do one piece of work every few seconds.
+
+Snapshotter and SamplingProfiler both run their work from a daemon
+thread until stopped; PeriodicThread holds the thread handling they
+share.
+"""
+import threading
+
+
+class PeriodicThread:
+    """Call tick() every interval seconds from a daemon thread.
+
+    Subclasses implement tick() and name their thread with thread_name.
+    stop() returns once the thread has finished its current tick.
+    """
+    thread_name = 'periodic'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=self.thread_name)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.tick()
+
+    def tick(self):
+        raise NotImplementedError
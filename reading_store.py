@@ -0,0 +1,274 @@
+import json
+import math
+import struct
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import compress, count
+
+from mapped_file import MappedFile, pad, padded
+from monitor import (BAND_STATUS, VITALS, normalize_vital_value,
+                     threshold_profile)
+
+# Column name and array typecode; values are float32, statuses int8
+COLUMN_TYPES = (('timestamps', 'd'), ('patients', 'I'), ('vitals', 'B'),
+                ('values', 'f'), ('statuses', 'b'))
+
+# Block header: magic, format version, reserved, rows, first and last time
+BLOCK_HEADER = struct.Struct('<4sHHIdd')
+BLOCK_MAGIC = b'VSEG'
+FORMAT_VERSION = 1
+
+Row = namedtuple(
+    'Row', ['timestamp', 'patient_id', 'vital', 'value', 'status'])
+
+HEADER_SIZE = padded(BLOCK_HEADER.size)
+
+
+class Columns:
+    """Typed columns of readings: arrays in memory, or views of a segment."""
+    __slots__ = tuple(name for name, _ in COLUMN_TYPES)
+
+    def __init__(self, *columns):
+        for (name, _), column in zip(COLUMN_TYPES, columns):
+            setattr(self, name, column)
+
+    @classmethod
+    def empty(cls):
+        return cls(*(array(typecode) for _, typecode in COLUMN_TYPES))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def columns(self):
+        return [getattr(self, name) for name, _ in COLUMN_TYPES]
+
+    def _patient_rows(self, patient):
+        if patient is None:
+            return range(len(self))
+        return compress(count(), map(patient.__eq__, self.patients))
+
+    def matching(self, patient=None, start=-math.inf, end=math.inf):
+        """Yield indices of rows of a patient index with start <= t < end."""
+        times = self.timestamps
+        return (row for row in self._patient_rows(patient)
+                if start <= times[row] < end)
+
+    def reclassify(self, vital_edges):
+        """Return an int8 array of statuses recomputed from the values.
+
+        vital_edges lists the compiled band edges per vital id.
+        """
+        return array('b', [
+            BAND_STATUS[bisect_right(vital_edges[vital_id], value)]
+            for vital_id, value in zip(self.vitals, self.values)])
+
+
+def _sidecar(path):
+    return f"{path}.json"
+
+
+def _load_names(path):
+    """Return (patient ids, vital names) saved next to a segment file."""
+    try:
+        with open(_sidecar(path)) as names:
+            saved = json.load(names)
+    except FileNotFoundError:
+        return [], []
+    return saved['patients'], saved['vitals']
+
+
+def _intern(index, names, name):
+    """Return the position of name in names, appending it the first time."""
+    position = index.get(name)
+    if position is None:
+        position = index[name] = len(names)
+        names.append(name)
+    return position
+
+
+class Names:
+    """Patient ids and vital names of a store, by their column index."""
+
+    def __init__(self, patients, vitals):
+        self.patients = patients
+        self.vitals = vitals
+        self._patient_index = {pid: i for i, pid in enumerate(patients)}
+        self._vital_index = {name: i for i, name in enumerate(vitals)}
+
+    def patient_index(self, patient_id):
+        return _intern(self._patient_index, self.patients, patient_id)
+
+    def patient_indices(self, patient_ids):
+        """Return the index of every patient id, interning new ones."""
+        known = self._patient_index
+        for patient_id in dict.fromkeys(patient_ids):
+            _intern(known, self.patients, patient_id)
+        return list(map(known.__getitem__, patient_ids))
+
+    def vital_index(self, vital):
+        """Return the index of a vital, checking a new name is a vital."""
+        if vital not in self._vital_index:
+            VITALS.spec(vital)
+        return _intern(self._vital_index, self.vitals, vital)
+
+    def patient_filter(self, patient_id):
+        """Return the index to filter rows on; None keeps every patient.
+
+        An unknown patient maps to an index no row carries.
+        """
+        if patient_id is None:
+            return None
+        return self._patient_index.get(patient_id, -1)
+
+    def row(self, columns, row):
+        return Row(columns.timestamps[row],
+                   self.patients[columns.patients[row]],
+                   self.vitals[columns.vitals[row]],
+                   columns.values[row], columns.statuses[row])
+
+    def vital_edges(self):
+        """Return the current band edges of every saved vital, by id."""
+        edges = threshold_profile().edges
+        return [edges[name] for name in self.vitals]
+
+
+class ReadingStore:
+    """Append readings to typed in-memory columns, flushed to a segment.
+
+    Each flush appends one block to the segment file at path and rewrites
+    the small JSON sidecar holding patient ids and vital names, so the
+    segment stays append-only. Values are stored normalized as float32;
+    statuses are computed from the full-precision value on append.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = Names(*_load_names(path)) if path else Names([], [])
+        self.columns = Columns.empty()
+
+    def __len__(self):
+        return len(self.columns)
+
+    def append(self, patient_id, timestamp, vital, value, unit=None):
+        """Store one reading and return its STATUS_* code."""
+        normalized = normalize_vital_value(vital, value, unit)
+        status = threshold_profile().classify(vital, normalized)
+        columns = self.columns
+        columns.timestamps.append(timestamp)
+        columns.patients.append(self.names.patient_index(patient_id))
+        columns.vitals.append(self.names.vital_index(vital))
+        columns.values.append(normalized)
+        columns.statuses.append(status)
+        return status
+
+    def scan(self, patient_id=None, start=-math.inf, end=math.inf):
+        """Yield Rows in memory for a patient (None: all) in [start, end)."""
+        patient = self.names.patient_filter(patient_id)
+        for row in self.columns.matching(patient, start, end):
+            yield self.names.row(self.columns, row)
+
+    def flush(self):
+        """Append the in-memory rows as one block; return rows written."""
+        written = len(self.columns)
+        if written:
+            _append_block(self.path, self.columns)
+            _save_names(self.path, self.names)
+            self.columns = Columns.empty()
+        return written
+
+
+def _save_names(path, names):
+    with open(_sidecar(path), 'w') as saved:
+        json.dump({'patients': names.patients, 'vitals': names.vitals},
+                  saved)
+
+
+def _append_block(path, columns):
+    times = columns.timestamps
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, FORMAT_VERSION, 0, len(times),
+                               min(times), max(times))
+    with open(path, 'ab') as segment:
+        segment.write(pad(header))
+        for column in columns.columns():
+            segment.write(pad(column.tobytes()))
+
+
+Block = namedtuple('Block', ['first', 'last', 'columns'])
+
+
+def _read_header(buffer, offset):
+    """Return (rows, first time, last time) of the block at offset."""
+    magic, version, _, rows, first, last = BLOCK_HEADER.unpack_from(
+        buffer, offset)
+    if magic != BLOCK_MAGIC or version != FORMAT_VERSION:
+        raise ValueError(
+            f"Not a version {FORMAT_VERSION} segment block at offset {offset}")
+    return rows, first, last
+
+
+def _overlaps(block, start, end):
+    return block.last >= start and block.first < end
+
+
+class Segment:
+    """Memory-mapped, read-only view of a segment file.
+
+    Block columns are memoryviews cast straight over the mapping, so
+    scans and replays read the file without copying it or building an
+    object per reading. Use as a context manager, or call close().
+    """
+
+    def __init__(self, path):
+        self.names = Names(*_load_names(path))
+        self._file = MappedFile(path)
+        self.blocks = list(self._read_blocks())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return sum(len(block.columns) for block in self.blocks)
+
+    def _read_block(self, offset):
+        rows, first, last = _read_header(self._file.map, offset)
+        offset += HEADER_SIZE
+        columns = []
+        for _, typecode in COLUMN_TYPES:
+            size = rows * array(typecode).itemsize
+            columns.append(self._file.view(offset, size, typecode))
+            offset += padded(size)
+        return Block(first, last, Columns(*columns)), offset
+
+    def _read_blocks(self):
+        offset = 0
+        while offset < len(self._file):
+            block, offset = self._read_block(offset)
+            yield block
+
+    def _overlapping(self, start, end):
+        return [block for block in self.blocks
+                if _overlaps(block, start, end)]
+
+    def scan(self, patient_id=None, start=-math.inf, end=math.inf):
+        """Yield Rows of a patient (None: all) with start <= t < end,
+        skipping blocks outside the time range."""
+        patient = self.names.patient_filter(patient_id)
+        for block in self._overlapping(start, end):
+            for row in block.columns.matching(patient, start, end):
+                yield self.names.row(block.columns, row)
+
+    def reclassify(self):
+        """Yield, per block, the statuses its values get under the current
+        limits, e.g. to audit a day of data after a limit change."""
+        vital_edges = self.names.vital_edges()
+        for block in self.blocks:
+            yield block.columns.reclassify(vital_edges)
+
+    def close(self):
+        """Release every view of the mapping and unmap the file."""
+        self.blocks = []
+        self._file.close()
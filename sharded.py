@@ -0,0 +1,537 @@
+"""Evaluate live readings on several cores, one shard of patients each.
+
+ShardedMonitor hashes every patient onto one of N worker processes with
+a jump consistent hash, so a patient always goes to the same worker and
+growing N moves as few patients as possible. Each worker runs its own
+MonitorEngine over its partition.
+
+Readings and transitions travel through single-producer,
+single-consumer ring buffers in shared memory as fixed-size records:
+no pickling, no pipes. Readings are queued, then numbered, packed with
+one struct call per shard and copied into the rings a whole batch at a
+time; a batch is handed over once it is full or FLUSH_AFTER seconds
+after its first reading. Workers sleep on an event until readings
+arrive. Transitions are merged back into one stream in sequence order,
+so the stream matches what a single MonitorEngine would yield for the
+same events, and readings of a patient are always evaluated in order.
+
+Sharding only pays off with a free core per worker besides the
+coordinator's; benchmarks/shard_scaling.py compares it with a single
+MonitorEngine.
+
+    with ShardedMonitor(shards=4, alerts=True) as monitor:
+        for transition in monitor.ingest(events):
+            ...
+"""
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import multiprocessing
+import operator
+import os
+import struct
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+import vitals_core
+from alert_state import AlertTracker
+from engine import NO_STATUS, MonitorEngine, Transition
+
+# Reading: sequence, patient index, code, timestamp, value; the code is
+# the vital id plus 256 times the unit id
+READING_RECORD = struct.Struct('<QIH2xdd')
+# Transition: sequence, patient index, code, previous and new status,
+# timestamp, value
+TRANSITION_RECORD = struct.Struct('<QIHBBdd')
+# Ring header: records written, records read, last sequence processed
+RING_HEADER = struct.Struct('<QQQ')
+DEFAULT_SLOTS = 65536
+BATCH_SIZE = 512
+# Seconds a partial batch waits for more readings before it is handed over
+FLUSH_AFTER = 0.002
+# Seconds between checks that the workers are alive while waiting on them
+WORKER_CHECK_INTERVAL = 0.05
+
+
+def jump_hash(key, buckets):
+    """Map a 64-bit key onto range(buckets), Lamping and Veach style.
+
+    Going from n to n + 1 buckets only moves keys into the new bucket.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * (1 << 31) / ((key >> 33) + 1))
+    return bucket
+
+
+def shard_of(patient_id, shards):
+    """Return the shard of a patient, the same in every process and run."""
+    digest = hashlib.blake2b(str(patient_id).encode(), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, 'little'), shards)
+
+
+@functools.lru_cache(maxsize=64)
+def _batch_struct(record_format, count):
+    return struct.Struct('<' + record_format[1:] * count)
+
+
+def pack_records(record, records):
+    """Pack a list of record tuples into bytes with one struct call."""
+    packer = _batch_struct(record.format, len(records))
+    return packer.pack(*itertools.chain.from_iterable(records))
+
+
+class SharedRing:
+    """Ring buffer of fixed-size records in shared memory.
+
+    One process puts records and one other process takes them, both as
+    packed bytes; each side only moves its own counter. Create it
+    without a name, attach to it from the other process by name.
+    """
+
+    def __init__(self, record, slots, name=None):
+        self.record = record
+        self.slots = slots
+        self.shm = SharedMemory(name, create=name is None,
+                                size=RING_HEADER.size + slots * record.size)
+        self.name = self.shm.name
+        self.counters = self.shm.buf[:RING_HEADER.size].cast('Q')
+        # The segment may be rounded up to a whole page
+        self.data = self.shm.buf[RING_HEADER.size:
+                                 RING_HEADER.size + slots * record.size]
+
+    def __len__(self):
+        """Records put and not taken yet."""
+        return self.counters[0] - self.counters[1]
+
+    @property
+    def processed(self):
+        """Last sequence the consumer has finished with."""
+        return self.counters[2]
+
+    @processed.setter
+    def processed(self, sequence):
+        self.counters[2] = sequence
+
+    def put(self, packed):
+        """Copy as many whole records of packed as fit; return the number
+        of bytes copied."""
+        written, size = self.counters[0], self.record.size
+        count = min(len(packed) // size, self.slots - len(self))
+        start, end = written % self.slots * size, count * size
+        first = min(end, len(self.data) - start)
+        self.data[start:start + first] = packed[:first]
+        self.data[:end - first] = packed[first:end]
+        self.counters[0] = written + count
+        return end
+
+    def take(self):
+        """Return every record waiting, oldest first, as packed bytes."""
+        read, size = self.counters[1], self.record.size
+        start, end = read % self.slots * size, len(self) * size
+        first = min(end, len(self.data) - start)
+        packed = bytes(self.data[start:start + first]) + bytes(
+            self.data[:end - first])
+        self.counters[1] = read + end // size
+        return packed
+
+    def close(self, unlink=False):
+        self.counters.release()
+        self.data.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _put_all(ring, packed, waiting):
+    """Put all of packed, calling waiting() while the ring is full."""
+    packed = memoryview(packed)
+    while packed := packed[ring.put(packed):]:
+        waiting()
+
+
+def _last_sequence(packed):
+    return READING_RECORD.unpack_from(packed, len(packed)
+                                      - READING_RECORD.size)[0]
+
+
+def configure(ranges, tolerance):
+    """Apply the coordinator's limits in a worker process."""
+    for vital, fields in ranges.items():
+        vitals_core.update_vital_range(vital, **fields)
+    vitals_core.set_warning_tolerance(tolerance)
+
+
+def code_pairs(vitals, units):
+    """Return {reading code: (vital, unit)} for every vital and unit."""
+    return {vital_id | unit_id << 8: (vital, unit)
+            for vital_id, vital in enumerate(vitals)
+            for unit_id, unit in enumerate(units)}
+
+
+def _transition_record(sequence, patient, code, transition):
+    previous = transition.previous
+    return (sequence, patient, code,
+            NO_STATUS if previous is None else previous, transition.status,
+            transition.timestamp, transition.value)
+
+
+class _ShardWorker:
+    """Worker side of one shard: evaluates the readings of one ring and
+    hands the transitions back through the other."""
+
+    def __init__(self, names, slots, pairs, alerts, signals):
+        self.readings = SharedRing(READING_RECORD, slots, names[0])
+        self.transitions = SharedRing(TRANSITION_RECORD, slots, names[1])
+        self.pairs = pairs
+        self.engine = MonitorEngine(alerts=AlertTracker() if alerts else None)
+        self.wakeup, self.collected, self.progress, self.stopping = signals
+
+    def drain(self):
+        """Return the readings waiting, first sleeping until there are
+        some or the worker is woken to stop."""
+        self.wakeup.clear()
+        if not len(self.readings):
+            self.wakeup.wait()
+        return self.readings.take()
+
+    def evaluate(self, packed):
+        """Observe packed readings; return their transitions as records."""
+        observe, pairs = self.engine.observe, self.pairs
+        changed = []
+        for sequence, patient, code, timestamp, value in (
+                READING_RECORD.iter_unpack(packed)):
+            vital, unit = pairs[code]
+            transition = observe(patient, timestamp, vital, value, unit)
+            if transition is not None:
+                changed.append(_transition_record(sequence, patient, code,
+                                                  transition))
+        return changed
+
+    def _blocked(self):
+        """Sleep until the coordinator has collected transitions."""
+        self.collected.wait()
+        self.collected.clear()
+
+    def push(self, changed, packed):
+        """Hand back the transitions of a batch, then mark it processed."""
+        _put_all(self.transitions, pack_records(TRANSITION_RECORD, changed),
+                 self._blocked)
+        if packed:
+            self.readings.processed = _last_sequence(packed)
+        self.progress.set()
+
+    def run(self):
+        """Evaluate batches until the coordinator sets stopping."""
+        while not self.stopping.is_set():
+            packed = self.drain()
+            self.push(self.evaluate(packed), packed)
+
+    def close(self):
+        self.readings.close()
+        self.transitions.close()
+
+
+def run_shard(names, slots, pairs, config, alerts, signals):
+    """Worker process: evaluate a shard's readings until stopped."""
+    configure(*config)
+    worker = _ShardWorker(names, slots, pairs, alerts, signals)
+    try:
+        worker.run()
+    finally:
+        worker.close()
+
+
+def unit_table():
+    """Return every unit spelling accepted by a vital, None first."""
+    spellings = set()
+    for vital in vitals_core.VITAL_RANGES:
+        spellings.update(vitals_core.VITALS.spec(vital).converters)
+    return (None, *sorted(spellings))
+
+
+def _shard_batches(shards, columns, count):
+    """Return the packed readings of each of count shards."""
+    groups = [[] for _ in range(count)]
+    for shard, record in zip(shards, zip(*columns)):
+        groups[shard].append(record)
+    return list(map(functools.partial(pack_records, READING_RECORD), groups))
+
+
+class _CodeTable(dict):
+    """(vital, unit) to reading code, checking each pair on first use."""
+
+    def __init__(self, vitals, units):
+        super().__init__()
+        self.vitals = vitals
+        self.units = units
+
+    def __missing__(self, key):
+        vital, unit = key
+        if vital not in vitals_core.VITAL_RANGES:
+            raise ValueError(f"Unknown vital: {vital}")
+        vitals_core.normalize_vital_value(vital, 0, unit)
+        code = self[key] = (self.vitals.index(vital)
+                            | self.units.index(unit) << 8)
+        return code
+
+
+class _Shard:
+    """Coordinator side of one worker: its rings, process and signals."""
+
+    def __init__(self, slots, progress, stopping):
+        self.readings = SharedRing(READING_RECORD, slots)
+        self.transitions = SharedRing(TRANSITION_RECORD, slots)
+        self.wakeup = multiprocessing.Event()
+        self.collected = multiprocessing.Event()
+        self.signals = (self.wakeup, self.collected, progress, stopping)
+        self.pushed = 0
+        self.process = None
+
+    def busy(self):
+        """Return True while readings handed over are not processed."""
+        return self.readings.processed < self.pushed
+
+    def settled_up_to(self):
+        """Return the sequence up to which all transitions are collected,
+        math.inf when every reading handed over has been processed."""
+        processed = self.readings.processed
+        return processed if processed < self.pushed else math.inf
+
+    def push(self, packed, waiting):
+        """Copy packed readings into the ring, waking the worker after
+        every copy and calling waiting() while the ring is full."""
+        packed = memoryview(packed)
+        while packed:
+            self.pushed = _last_sequence(packed)
+            packed = packed[self.readings.put(packed):]
+            self.wakeup.set()
+            if packed:
+                waiting()
+
+    def take_transitions(self):
+        packed = self.transitions.take()
+        if packed:
+            self.collected.set()
+        return packed
+
+    def close(self):
+        self.readings.close(unlink=True)
+        self.transitions.close(unlink=True)
+
+
+def _pop_until(heap, bound):
+    """Pop the records of heap with a sequence up to bound, in order."""
+    popped = []
+    while heap and heap[0][0] <= bound:
+        popped.append(heapq.heappop(heap))
+    return popped
+
+
+class ShardedMonitor:
+    """Evaluate readings in shards worker processes, one MonitorEngine
+    each, and merge their transitions into one ordered stream.
+
+    Limits are copied into the workers when they start. alerts=True
+    gives every worker an AlertTracker, as MonitorEngine(alerts=...).
+    """
+
+    def __init__(self, shards=None, alerts=False, slots=DEFAULT_SLOTS):
+        self.shards = shards or os.cpu_count()
+        self.alerts = alerts
+        self.slots = slots
+        self.readings = 0
+        self.vitals = tuple(vitals_core.VITAL_RANGES)
+        self.units = unit_table()
+        self._codes = _CodeTable(self.vitals, self.units)
+        self._patients = {}
+        self._patient_ids = []
+        self._pending = collections.deque()
+        self._collected = []
+        self._shards = []
+        self._lock = threading.RLock()
+        self._queued = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher = None
+        self._progress = None
+        self._stop_workers = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _start_shard(self, number, config, pairs):
+        shard = _Shard(self.slots, self._progress, self._stop_workers)
+        shard.process = multiprocessing.Process(
+            target=run_shard, name=f"monitor-shard-{number}", daemon=True,
+            args=((shard.readings.name, shard.transitions.name), self.slots,
+                  pairs, config, self.alerts, shard.signals))
+        shard.process.start()
+        return shard
+
+    def start(self):
+        """Start the worker processes and the thread handing over partial
+        batches; returns the monitor for chaining."""
+        config = (vitals_core.VITAL_RANGES,
+                  vitals_core.WARNING_TOLERANCE_PERCENT)
+        pairs = code_pairs(self.vitals, self.units)
+        self._progress = multiprocessing.Event()
+        self._stop_workers = multiprocessing.Event()
+        self._shards = [self._start_shard(number, config, pairs)
+                        for number in range(self.shards)]
+        self._stopping.clear()
+        self._flusher = threading.Thread(target=self._run, daemon=True,
+                                         name='shard-flusher')
+        self._flusher.start()
+        return self
+
+    def _place(self, patient_id):
+        self._patients[patient_id] = (len(self._patient_ids),
+                                      shard_of(patient_id, self.shards))
+        self._patient_ids.append(patient_id)
+
+    def _placements(self, patient_ids):
+        """Return (patient index, shard) of every patient id."""
+        for patient_id in set(patient_ids).difference(self._patients):
+            self._place(patient_id)
+        return list(map(self._patients.__getitem__, patient_ids))
+
+    def submit(self, patient_id, timestamp, vital, value, unit=None):
+        """Queue one reading for the worker owning the patient.
+
+        It is handed over with a full batch, or FLUSH_AFTER seconds later
+        by the flusher thread.
+        """
+        pending = self._pending
+        pending.append((patient_id, timestamp, self._codes[vital, unit],
+                        value))
+        if len(pending) >= BATCH_SIZE:
+            self._dispatch_pending()
+        elif not self._queued.is_set():
+            self._queued.set()
+
+    def _dispatch(self, events):
+        """Number the queued events, pack them per shard and hand them over."""
+        patient_ids, timestamps, codes, values = zip(*events)
+        patients, shards = zip(*self._placements(patient_ids))
+        first = self.readings + 1
+        self.readings += len(events)
+        sequences = range(first, first + len(events))
+        batches = _shard_batches(
+            shards, (sequences, patients, codes, timestamps, values),
+            len(self._shards))
+        for shard, packed in zip(self._shards, batches):
+            shard.push(packed, self._wait)
+
+    def _take_pending(self):
+        popleft = self._pending.popleft
+        return list(map(operator.call, [popleft] * len(self._pending)))
+
+    def _dispatch_pending(self):
+        """Hand over queued readings until none are left, including those
+        submitted meanwhile."""
+        with self._lock:
+            while self._pending:
+                self._dispatch(self._take_pending())
+
+    def _run(self):
+        """Flusher thread: hand over a partial batch FLUSH_AFTER seconds
+        after its first reading was queued."""
+        while not self._stopping.is_set():
+            self._queued.wait()
+            self._stopping.wait(FLUSH_AFTER)
+            self._queued.clear()
+            self._flush_queued()
+
+    def _flush_queued(self):
+        try:
+            self._dispatch_pending()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                'Handing over queued readings failed')
+
+    def _check_workers(self):
+        for shard in self._shards:
+            if not shard.process.is_alive():
+                raise RuntimeError(f"{shard.process.name} exited with code "
+                                   f"{shard.process.exitcode}")
+
+    def _wait(self):
+        """Collect transitions and sleep until a worker makes progress."""
+        self._collect()
+        self._check_workers()
+        self._progress.wait(WORKER_CHECK_INTERVAL)
+        self._progress.clear()
+
+    def _collect(self):
+        for shard in self._shards:
+            for record in TRANSITION_RECORD.iter_unpack(
+                    shard.take_transitions()):
+                heapq.heappush(self._collected, record)
+
+    def _transition(self, record):
+        sequence, patient, code, previous, status, timestamp, value = record
+        return Transition(self._patient_ids[patient], timestamp,
+                          self.vitals[code & 0xFF],
+                          None if previous == NO_STATUS else previous,
+                          status, value)
+
+    def ready(self):
+        """Return the transitions every earlier reading has settled."""
+        with self._lock:
+            bound = min(map(_Shard.settled_up_to, self._shards),
+                        default=math.inf)
+            self._collect()
+            return list(map(self._transition,
+                            _pop_until(self._collected, bound)))
+
+    def flush(self):
+        """Hand over every queued reading, wait for the workers to finish
+        them and return the remaining transitions in order."""
+        with self._lock:
+            self._dispatch_pending()
+            while any(map(_Shard.busy, self._shards)):
+                self._wait()
+            return self.ready()
+
+    def ingest(self, events):
+        """Consume (patient_id, timestamp, vital, value, unit) events and
+        yield a Transition for every status change, in event order."""
+        submit = self.submit
+        for count, event in enumerate(events, 1):
+            submit(*event)
+            if count % BATCH_SIZE == 0:
+                yield from self.ready()
+        yield from self.flush()
+
+    def stop(self):
+        """Finish queued readings, stop the workers and free the rings.
+
+        Returns the transitions not yet taken.
+        """
+        if self._flusher is None:
+            return []
+        self._stopping.set()
+        self._queued.set()
+        self._flusher.join()
+        self._flusher = None
+        remaining = self.flush()
+        self._shut_down_shards()
+        return remaining
+
+    def _shut_down_shards(self):
+        self._stop_workers.set()
+        for shard in self._shards:
+            shard.wakeup.set()
+        for shard in self._shards:
+            shard.process.join()
+            shard.close()
+        self._shards = []
@@ -0,0 +1,290 @@
+"""Binary snapshots of MonitorEngine state for fast failover.
+
+A snapshot holds the latest status byte of every patient and vital and,
+when the engine has an AlertTracker, the alerts waiting out their dwell
+time, so a restarted gateway carries on without re-alerting everyone.
+Snapshotter rewrites the file in the background while ingestion goes
+on; restore() maps the file and rebuilds the engine from it.
+
+The header records a digest of VITAL_RANGES, the vital ids statuses are
+stored under, the warning tolerance and VITAL_ALERTING. Statuses and
+pending alerts are only meaningful under the limits, vital ids and
+alerting policy they were computed with, so restoring a snapshot taken
+under others raises ValueError.
+"""
+import hashlib
+import json
+import os
+import struct
+from array import array
+from operator import itemgetter
+from time import sleep
+
+import vitals_core
+from alert_state import AlertTracker
+from engine import NO_STATUS, MonitorEngine
+from mapped_file import MappedFile, pad, padded
+from periodic import PeriodicThread
+
+# Header: magic, format version, flags, configuration digest, patients,
+# vitals, size of the patient id JSON, reserved, readings seen
+SNAPSHOT_HEADER = struct.Struct('<4sHH16sIIIIQ')
+SNAPSHOT_MAGIC = b'VSNP'
+FORMAT_VERSION = 1
+HAS_PENDING_ALERTS = 0x1
+# Patients copied between pauses that let ingestion threads run
+CHUNK_PATIENTS = 4096
+SNAPSHOT_INTERVAL = 5.0
+
+
+def config_digest():
+    """Return a digest of the limits and alerting policy that statuses
+    and pending alerts are computed under."""
+    config = [list(vitals_core.VITALS.ids), vitals_core.VITAL_RANGES,
+              vitals_core.WARNING_TOLERANCE_PERCENT,
+              vitals_core.VITAL_ALERTING]
+    encoded = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+def _chunks(items, size):
+    """Yield slices of items, pausing between them for other threads."""
+    for start in range(0, len(items), size):
+        if start:
+            sleep(0)
+        yield items[start:start + size]
+
+
+def _pending_rows(pending, vitals):
+    """Return the pending status and since rows of one patient."""
+    status, since = pending
+    return (bytes(status).ljust(vitals, b'\xff'),
+            since.tobytes().ljust(8 * vitals, b'\0'))
+
+
+def _status_rows(engine, vitals, states):
+    """Copy the status row of each (patient id, state) pair."""
+    return [(bytes(state).ljust(vitals, b'\xff'),) for _, state in states]
+
+
+def _alert_rows(engine, vitals, states):
+    """Copy the status, pending status and since rows of each (patient
+    id, state) pair, the rows of a patient in one step."""
+    pending_of = engine.alerts.pending
+    idle = (bytes([NO_STATUS]) * vitals, array('d', bytes(8 * vitals)))
+    return [(bytes(state).ljust(vitals, b'\xff'),
+             *_pending_rows(pending_of(patient_id) or idle, vitals))
+            for patient_id, state in states]
+
+
+def _row_copier(engine):
+    """Return the row copier of an engine and its empty sections."""
+    if engine.alerts is None:
+        return _status_rows, [bytearray()]
+    return _alert_rows, [bytearray(), bytearray(), bytearray()]
+
+
+def _append_rows(sections, rows):
+    """Append the per-patient rows of a chunk to their sections."""
+    for section, column in zip(sections, zip(*rows)):
+        section += b''.join(column)
+
+
+def _sections(engine, chunk):
+    """Return (readings, patient ids, sections) copied from the engine.
+
+    Each patient's status, pending statuses and since times are copied
+    together, and the reading count in the same step as the list of
+    patients.
+    """
+    readings, states = engine.readings, engine.patient_states()
+    vitals = len(engine.vital_index)
+    copy_rows, sections = _row_copier(engine)
+    for part in _chunks(states, chunk):
+        _append_rows(sections, copy_rows(engine, vitals, part))
+    return readings, list(map(itemgetter(0), states)), sections
+
+
+def write_snapshot(engine, path, chunk=CHUNK_PATIENTS):
+    """Write the state of engine to path, replacing it atomically.
+
+    States are copied chunk patients at a time, each patient in one
+    step, so the snapshot is consistent per patient. Returns the number
+    of patients written.
+    """
+    readings, patient_ids, sections = _sections(engine, chunk)
+    flags = 0 if engine.alerts is None else HAS_PENDING_ALERTS
+    ids = json.dumps(patient_ids).encode()
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, FORMAT_VERSION, flags, config_digest(),
+        len(patient_ids), len(engine.vital_index), len(ids), 0, readings)
+    partial = f"{path}.tmp"
+    with open(partial, 'wb') as snapshot:
+        snapshot.write(pad(header))
+        snapshot.write(pad(ids))
+        for section in sections:
+            snapshot.write(pad(section))
+    os.replace(partial, path)
+    return len(patient_ids)
+
+
+class Snapshot:
+    """Memory-mapped, read-only view of a snapshot file.
+
+    statuses, and with pending alerts pending and since, are flat
+    memoryviews with one entry per patient and vital, patient-major.
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, path):
+        self._file = MappedFile(path)
+        self._read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+    def _read(self):
+        (magic, version, self.flags, self.digest, patients, self.vitals,
+         ids_size, _, self.readings) = SNAPSHOT_HEADER.unpack_from(
+             self._file.map)
+        if (magic, version) != (SNAPSHOT_MAGIC, FORMAT_VERSION):
+            raise ValueError(f"Not a version {FORMAT_VERSION} snapshot")
+        offset = padded(SNAPSHOT_HEADER.size)
+        self.patient_ids = json.loads(self._file.map[offset:offset + ids_size])
+        self._index = dict(zip(self.patient_ids, range(patients)))
+        offset += padded(ids_size)
+        rows = patients * self.vitals
+        self.statuses, offset = self._view(offset, rows, 'B')
+        self.pending = self.since = None
+        if self.flags & HAS_PENDING_ALERTS:
+            self.pending, offset = self._view(offset, rows, 'B')
+            self.since, offset = self._view(offset, rows * 8, 'd')
+
+    def _view(self, offset, size, typecode):
+        return self._file.view(offset, size, typecode), offset + padded(size)
+
+    def is_current(self):
+        """Return True if the snapshot was taken under the current limits."""
+        return self.digest == config_digest()
+
+    def rows(self, section):
+        """Return RestoredRows over a section, one row per patient."""
+        return RestoredRows(self._index, section.tobytes(),
+                            self.vitals * section.itemsize)
+
+    def close(self):
+        """Release every view of the mapping and unmap the file."""
+        self._file.close()
+
+
+class RestoredRows:
+    """Rows of one snapshot section by patient id, as bytes.
+
+    Stands in for the patients an engine or tracker has not seen since
+    restoring: pop takes a patient out as it is used, so len and items
+    only cover the untouched ones.
+    """
+    __slots__ = ('index', 'data', 'size')
+
+    def __init__(self, index, data, size):
+        self.index = dict(index)
+        self.data = data
+        self.size = size
+
+    def __len__(self):
+        return len(self.index)
+
+    def _row(self, row):
+        start = row * self.size
+        return self.data[start:start + self.size]
+
+    def __getitem__(self, patient_id):
+        return self._row(self.index[patient_id])
+
+    def get(self, patient_id, default=None):
+        row = self.index.get(patient_id)
+        return default if row is None else self._row(row)
+
+    def pop(self, patient_id, default=None):
+        row = self.index.pop(patient_id, None)
+        return default if row is None else self._row(row)
+
+    def items(self):
+        return [(patient_id, self._row(row))
+                for patient_id, row in list(self.index.items())]
+
+
+def _load_alerts(snapshot, alerts):
+    """Return alerts, or a new AlertTracker, holding the pending alerts
+    of a snapshot."""
+    if alerts is None:
+        alerts = AlertTracker()
+    alerts.load_pending(snapshot.rows(snapshot.pending),
+                        snapshot.rows(snapshot.since))
+    return alerts
+
+
+def restore(path, alerts=None):
+    """Return a MonitorEngine holding the state saved at path.
+
+    Pending alerts are restored into alerts, a new AlertTracker when the
+    snapshot has them and none is given. Patients are copied out of the
+    snapshot on their next reading, so this costs one copy of each
+    section rather than work per patient. Raises ValueError if the
+    snapshot was taken under other limits, another alerting policy or
+    another set of vitals.
+    """
+    with Snapshot(path) as snapshot:
+        if not snapshot.is_current():
+            raise ValueError(f"Snapshot {path} was taken under other "
+                             f"VITAL_RANGES or VITAL_ALERTING")
+        if snapshot.pending is not None:
+            alerts = _load_alerts(snapshot, alerts)
+        engine = MonitorEngine(alerts=alerts)
+        engine.load_states(snapshot.rows(snapshot.statuses),
+                           snapshot.readings)
+    return engine
+
+
+class Snapshotter(PeriodicThread):
+    """Rewrite the snapshot of an engine every interval seconds.
+
+    Runs in a background thread; ingestion is never stopped, and a
+    snapshot is only written when readings arrived since the last one.
+    Every snapshot rewrites the whole file rather than tracking changed
+    patients, which keeps each file one atomically replaced copy;
+    benchmarks/snapshot_restore.py measures what that costs.
+    """
+    thread_name = 'snapshotter'
+
+    def __init__(self, engine, path, interval=SNAPSHOT_INTERVAL):
+        super().__init__(interval)
+        self.engine = engine
+        self.path = path
+        self.written = 0
+        self._saved_readings = None
+
+    def stop(self):
+        """Stop the thread, then write a final snapshot."""
+        super().stop()
+        self.snapshot()
+        return self
+
+    def snapshot(self):
+        """Write a snapshot now if the engine saw readings since the last."""
+        readings = self.engine.readings
+        if readings == self._saved_readings:
+            return False
+        write_snapshot(self.engine, self.path)
+        self._saved_readings = readings
+        self.written += 1
+        return True
+
+    def tick(self):
+        self.snapshot()
@@ -0,0 +1,257 @@
+import math
+import operator
+from array import array
+from collections import deque, namedtuple
+
+from monitor import (VITAL_TRENDS, WARNING_DIRECTIONS, normalize_vital_value,
+                     threshold_profile)
+
+TrendAlert = namedtuple(
+    'TrendAlert', ['patient_id', 'timestamp', 'vital', 'kind', 'message'])
+
+
+class RollingWindow:
+    """Ring buffer of (time, value) samples with O(1) running statistics.
+
+    Holds at most capacity samples, none older than max_age seconds before
+    the newest one. Mean, variance and least-squares slope come from
+    running sums; min and max from monotonic queues. Sums are rebuilt
+    from the buffer once per capacity evictions to stop rounding drift.
+    """
+    __slots__ = ('capacity', 'max_age', 'times', 'values', 'head', 'size',
+                 'appended', 'evicted', 'origin', 'sums', 'lows', 'highs')
+
+    def __init__(self, capacity, max_age=None):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self.appended = 0
+        self.evicted = 0
+        self.origin = 0.0
+        # n is self.size; sums are t, v, t*t, v*v, t*v with t from origin
+        self.sums = [0.0] * 5
+        self.lows = deque()
+        self.highs = deque()
+
+    def __len__(self):
+        return self.size
+
+    def _accumulate(self, timestamp, value, sign):
+        t = timestamp - self.origin
+        sums = self.sums
+        sums[0] += sign * t
+        sums[1] += sign * value
+        sums[2] += sign * t * t
+        sums[3] += sign * value * value
+        sums[4] += sign * t * value
+
+    def _rebuild_sums(self):
+        self.origin = self.times[self.head] if self.size else 0.0
+        self.sums = [0.0] * 5
+        for offset in range(self.size):
+            slot = (self.head + offset) % self.capacity
+            self._accumulate(self.times[slot], self.values[slot], 1)
+
+    def _evict_oldest(self):
+        slot = self.head
+        self._accumulate(self.times[slot], self.values[slot], -1)
+        self.head = (slot + 1) % self.capacity
+        self.size -= 1
+        self.evicted += 1
+        if self.evicted % self.capacity == 0:
+            self._rebuild_sums()
+
+    def _evict_expired(self, now):
+        horizon = now - self.max_age
+        while self.size and self.times[self.head] < horizon:
+            self._evict_oldest()
+
+    @staticmethod
+    def _push_monotonic(queue, sequence, value, keeps):
+        while queue and not keeps(queue[-1][1], value):
+            queue.pop()
+        queue.append((sequence, value))
+
+    @staticmethod
+    def _front(queue, oldest):
+        while queue[0][0] < oldest:
+            queue.popleft()
+        return queue[0][1]
+
+    def _make_room(self, timestamp):
+        if self.size == self.capacity:
+            self._evict_oldest()
+        if self.max_age is not None:
+            self._evict_expired(timestamp)
+
+    def _restart(self, timestamp):
+        self.origin = timestamp
+        self.sums = [0.0] * 5
+
+    def append(self, timestamp, value):
+        """Add a sample, evicting the oldest ones beyond count or age."""
+        self._make_room(timestamp)
+        if not self.size:
+            self._restart(timestamp)
+        slot = (self.head + self.size) % self.capacity
+        self.times[slot] = timestamp
+        self.values[slot] = value
+        self.size += 1
+        self._accumulate(timestamp, value, 1)
+        self._push_monotonic(self.lows, self.appended, value, operator.le)
+        self._push_monotonic(self.highs, self.appended, value, operator.ge)
+        self.appended += 1
+        self.min()
+        self.max()
+
+    @property
+    def span(self):
+        """Seconds between the oldest and the newest sample."""
+        newest = (self.head + self.size - 1) % self.capacity
+        return self.times[newest] - self.times[self.head] if self.size else 0.0
+
+    def mean(self):
+        """Mean of the values in the window."""
+        return self.sums[1] / self.size
+
+    def variance(self):
+        """Population variance of the values in the window."""
+        mean = self.mean()
+        return max(0.0, self.sums[3] / self.size - mean * mean)
+
+    def slope(self):
+        """Least-squares change of value per second; 0.0 when undefined."""
+        n = self.size
+        sum_t, sum_v, sum_tt, _, sum_tv = self.sums
+        denominator = n * sum_tt - sum_t * sum_t
+        if n < 2 or denominator <= 0:
+            return 0.0
+        return (n * sum_tv - sum_t * sum_v) / denominator
+
+    def min(self):
+        """Smallest value in the window; also prunes expired entries."""
+        return self._front(self.lows, self.appended - self.size)
+
+    def max(self):
+        """Largest value in the window; also prunes expired entries."""
+        return self._front(self.highs, self.appended - self.size)
+
+
+class _Trend:
+    """Rolling window of one patient's vital, the status of its latest
+    reading and since when it has had it, and the trend checks it
+    currently fails."""
+    __slots__ = ('window', 'status', 'since', 'failing')
+
+    def __init__(self, rule):
+        self.window = RollingWindow(window_capacity(rule),
+                                    rule['window_seconds'])
+        self.status = None
+        self.since = None
+        self.failing = frozenset()
+
+    def append(self, timestamp, value, status):
+        self.window.append(timestamp, value)
+        if status != self.status:
+            self.status, self.since = status, timestamp
+
+    def near_limit_for(self, now):
+        """Seconds the readings have stayed in one warning band, or 0."""
+        return now - self.since if self.status in WARNING_DIRECTIONS else 0
+
+
+def _is_rapid_rise(trend, rule, now):
+    """True when the value climbs faster than rise_per_minute."""
+    limit = rule['rise_per_minute']
+    return limit is not None and trend.window.slope() * 60 >= limit
+
+
+def _is_rapid_fall(trend, rule, now):
+    """True when the value drops faster than fall_per_minute."""
+    limit = rule['fall_per_minute']
+    return limit is not None and -trend.window.slope() * 60 >= limit
+
+
+def _is_sustained_near_limit(trend, rule, now):
+    """True when the readings sat in one warning band for
+    near_limit_seconds, however long the window."""
+    return trend.near_limit_for(now) >= rule['near_limit_seconds']
+
+
+TREND_CHECKS = (
+    ('rapid_rise', _is_rapid_rise),
+    ('rapid_fall', _is_rapid_fall),
+    ('sustained_near_limit', _is_sustained_near_limit),
+)
+
+
+def _failing(trend, rule, now):
+    """Return the kinds of the trend checks the trend fails, in order."""
+    return [kind for kind, check in TREND_CHECKS if check(trend, rule, now)]
+
+
+def _trend_alerts(patient_id, timestamp, vital, trend, rule):
+    """Return a TrendAlert for every trend check the trend began failing."""
+    failing = _failing(trend, rule, timestamp)
+    failed, trend.failing = trend.failing, frozenset(failing)
+    return [TrendAlert(patient_id, timestamp, vital, kind, rule[kind])
+            for kind in failing if kind not in failed]
+
+
+def window_capacity(rule):
+    """Return the samples a window needs to cover window_seconds of
+    readings arriving at max_rate per second."""
+    return math.ceil(rule['window_seconds'] * rule['max_rate']) + 1
+
+
+class TrendMonitor:
+    """Rolling windows per patient and vital, checked against trend rules.
+
+    An alert is raised when a check starts failing, not again while it
+    keeps failing. Memory is bounded by window_capacity(rule) samples
+    per patient and vital; vitals without a rule are ignored.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = VITAL_TRENDS if rules is None else rules
+        # Patient id to {vital: _Trend}
+        self._trends = {}
+
+    def _trend(self, patient_id, vital):
+        trends = self._trends.get(patient_id)
+        if trends is None:
+            trends = self._trends[patient_id] = {}
+        trend = trends.get(vital)
+        if trend is None:
+            trend = trends[vital] = _Trend(self.rules[vital])
+        return trend
+
+    def window(self, patient_id, vital):
+        """Return the rolling window of a patient's vital, creating it."""
+        return self._trend(patient_id, vital).window
+
+    def forget(self, patient_id):
+        """Drop every window of a discharged patient."""
+        self._trends.pop(patient_id, None)
+
+    def observe(self, patient_id, timestamp, vital, value, unit=None):
+        """Add a reading and return the TrendAlerts it raises."""
+        rule = self.rules.get(vital)
+        if rule is None:
+            return []
+        value = normalize_vital_value(vital, value, unit)
+        trend = self._trend(patient_id, vital)
+        trend.append(timestamp, value,
+                     threshold_profile().classify(vital, value))
+        if trend.window.span < rule['min_seconds']:
+            return []
+        return _trend_alerts(patient_id, timestamp, vital, trend, rule)
+
+    def ingest(self, events):
+        """Consume (patient_id, timestamp, vital, value, unit) events and
+        yield every TrendAlert."""
+        for event in events:
+            yield from self.observe(*event)
@@ -0,0 +1,262 @@
+from collections import deque
+
+MMHG_PER_KPA = 7.50062
+GLUCOSE_MG_DL_PER_MMOL_L = 18.016
+
+
+def celsius_to_fahrenheit(celsius):
+    """Convert Celsius to Fahrenheit."""
+    return (celsius * 9/5) + 32
+
+
+def fahrenheit_to_celsius(fahrenheit):
+    """Convert Fahrenheit to Celsius."""
+    return (fahrenheit - 32) * 5/9
+
+
+def kelvin_to_celsius(kelvin):
+    """Convert Kelvin to Celsius."""
+    return kelvin - 273.15
+
+
+def celsius_to_kelvin(celsius):
+    """Convert Celsius to Kelvin."""
+    return celsius + 273.15
+
+
+def scale_by(factor):
+    """Return a conversion multiplying by a constant factor."""
+    return lambda value: value * factor
+
+
+# Direct conversions as (from unit, to unit, forward, backward)
+UNIT_CONVERSIONS = (
+    ('C', 'F', celsius_to_fahrenheit, fahrenheit_to_celsius),
+    ('K', 'C', kelvin_to_celsius, celsius_to_kelvin),
+    ('kPa', 'mmHg', scale_by(MMHG_PER_KPA), scale_by(1 / MMHG_PER_KPA)),
+    ('mmol/L', 'mg/dL', scale_by(GLUCOSE_MG_DL_PER_MMOL_L),
+     scale_by(1 / GLUCOSE_MG_DL_PER_MMOL_L)),
+)
+
+
+def _identity(value):
+    return value
+
+
+def _compose(first, then):
+    """Return one function applying first, then then."""
+    if then is _identity:
+        return first
+    return lambda value: then(first(value))
+
+
+def _incoming_edges(conversions):
+    """Map each unit to the (source unit, conversion) pairs reaching it."""
+    incoming = {}
+    for source, target, forward, backward in conversions:
+        incoming.setdefault(target, []).append((source, forward))
+        incoming.setdefault(source, []).append((target, backward))
+    return incoming
+
+
+def _extend(incoming, reached, converters):
+    """Add converters for units one conversion away from reached."""
+    for source, to_reached in incoming.get(reached, ()):
+        if source not in converters:
+            converters[source] = _compose(to_reached, converters[reached])
+            yield source
+
+
+def converters_to(unit, conversions=UNIT_CONVERSIONS):
+    """Return {unit: function} converting every reachable unit to unit.
+
+    Paths through the conversion graph are walked once here and composed
+    into a single function per source unit.
+    """
+    incoming = _incoming_edges(conversions)
+    converters = {unit: _identity}
+    pending = deque([unit])
+    while pending:
+        pending.extend(_extend(incoming, pending.popleft(), converters))
+    return converters
+
+
+def _spellings(unit):
+    return {unit, unit.upper(), unit.lower()}
+
+
+class RangeTable(dict):
+    """A VITAL_RANGES style table that counts its edits.
+
+    Dicts stored in the table are copied into RangeTables too. All of
+    them share one `edits` counter, so a cache compiled from the table
+    can tell it went stale, even after a nested edit such as
+    table['pulse']['max'] = 120.
+    """
+    edits = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    @staticmethod
+    def _edited():
+        RangeTable.edits += 1
+
+    def __setitem__(self, key, value):
+        if isinstance(value, dict):
+            value = RangeTable(value)
+        super().__setitem__(key, value)
+        self._edited()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._edited()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._edited()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._edited()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._edited()
+
+
+class VitalSpec:
+    """Compiled description of a vital: unit converters and display.
+
+    converters maps every accepted spelling of every accepted unit to a
+    direct conversion into the standard unit; unit_names maps the same
+    spellings back to the configured unit name. components names the
+    component vitals of a multi-component vital such as blood pressure.
+    """
+    __slots__ = ('name', 'vital_id', 'unit', 'converters', 'unit_names',
+                 'assumed_max', 'display', 'components')
+
+    def __init__(self, name, vital_id, config, components=None):
+        self.name = name
+        self.vital_id = vital_id
+        self.unit = config.get('standard_unit')
+        self.assumed_max = config.get('assumed_max')
+        self.display = config.get('display')
+        self.components = components
+        self.converters = {}
+        self.unit_names = {}
+        self._add_units(config.get('units', (self.unit,)))
+
+    def _add_units(self, units):
+        reachable = converters_to(self.unit)
+        for unit in units:
+            if unit not in reachable:
+                raise ValueError(
+                    f"No conversion from {unit} to {self.unit} for {self.name}")
+            self._add_spellings(unit, reachable[unit])
+
+    def _add_spellings(self, unit, converter):
+        for spelling in _spellings(unit):
+            self.converters[spelling] = converter
+            self.unit_names[spelling] = unit
+
+
+def _component_config(config, component_config):
+    """Return the config of a component, inheriting the parent's units."""
+    merged = {key: value for key, value in config.items()
+              if key != 'components'}
+    merged.update(component_config)
+    return merged
+
+
+class VitalRegistry:
+    """VitalSpecs compiled on first use from a VITAL_RANGES style table.
+
+    Vital ids follow the order vitals appear in the table or are
+    registered, and stay stable for the life of the registry.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+        self.ids = {name: vital_id for vital_id, name in enumerate(ranges)}
+        self._specs = {}
+        self._composites = {}
+
+    def _vital_id(self, name):
+        return self.ids.setdefault(name, len(self.ids))
+
+    def spec(self, name):
+        """Return the compiled spec of a vital or multi-component vital."""
+        spec = self._specs.get(name) or self._composites.get(name)
+        if spec is None:
+            config = self.ranges[name]
+            spec = VitalSpec(name, self._vital_id(name), config)
+            self._specs[name] = spec
+        return spec
+
+    def normalize(self, vital_name, value, unit):
+        """Convert value from unit to the standard unit of the vital."""
+        spec = self.spec(vital_name)
+        try:
+            convert = spec.converters[unit]
+        except KeyError:
+            raise ValueError(
+                f"Unsupported {vital_name} unit: {unit}. "
+                f"Use one of {sorted(set(spec.unit_names.values()))}."
+            ) from None
+        return convert(value)
+
+    def register(self, name, config):
+        """Add a vital to the ranges table, compiling it right away.
+
+        A config with 'components' registers one vital per component,
+        named '<name>.<component>', which share the parent's units.
+        Raises ValueError if config has no 'standard_unit'.
+        """
+        if 'standard_unit' not in config:
+            raise ValueError(f"Vital {name} needs a standard_unit")
+        components = config.get('components')
+        if components is None:
+            self.ranges[name] = config
+            self.invalidate(name)
+            return self.spec(name)
+        return self._register_composite(name, config, components)
+
+    def _register_composite(self, name, config, components):
+        names = tuple(f"{name}.{component}" for component in components)
+        for component_name, component in zip(names, components.values()):
+            self.register(component_name, _component_config(config, component))
+        spec = VitalSpec(name, None, config, components=names)
+        self._composites[name] = spec
+        return spec
+
+    def unregister(self, name):
+        """Remove a vital, and its components, from the table."""
+        spec = self.spec(name)
+        self._composites.pop(name, None)
+        for component_name in spec.components or (name,):
+            self.ranges.pop(component_name, None)
+            self.invalidate(component_name)
+
+    def invalidate(self, name=None):
+        """Drop compiled specs so they are rebuilt from the table."""
+        if name is None:
+            self._specs.clear()
+            return
+        self._specs.pop(name, None)
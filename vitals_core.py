@@ -0,0 +1,462 @@
+"""Pure vital sign classification: configuration, units, ranges, status.
+
+Nothing here prints or alerts and the only imports are small, so
+short-lived checkers can import this module, or monitor, which loads
+the displayed warnings and alerts of vitals_report only on first use.
+"""
+import math
+from bisect import bisect_right
+from itertools import repeat
+
+from vital_registry import RangeTable, VitalRegistry, celsius_to_fahrenheit
+
+# WARNING_TOLERANCE_PERCENT is rebound by set_warning_tolerance, so it is
+# left out and read through the module instead of copied
+__all__ = [
+    'VITAL_RANGES', 'AGE_BANDS', 'AGE_BAND_LIMITS', 'VITAL_TRENDS',
+    'VITAL_ALERTING', 'VITALS', 'celsius_to_fahrenheit',
+    'normalize_temperature', 'normalize_vital_value',
+    'warning_ranges_for_limits', 'calculate_warning_ranges', 'STATUS_OK',
+    'STATUS_WARNING_LOW', 'STATUS_WARNING_HIGH', 'STATUS_CRITICAL',
+    'BAND_STATUS', 'STATUS_RESULTS', 'WARNING_DIRECTIONS',
+    'STATUS_MESSAGE_KEYS', 'READING_ERRORS', 'compile_edges',
+    'compile_vital_edges', 'ThresholdProfile', 'threshold_profile',
+    'invalidate_threshold_profile', 'update_vital_range', 'register_vital',
+    'unregister_vital', 'set_warning_tolerance', 'classify_vital',
+    'is_vital_ok', 'is_in_warning_range', 'extract_vital_data',
+    'vital_readings', 'panel_readings', 'PanelPlan', 'PanelReport',
+    'panel_plan', 'panel_verdict', 'panel_report',
+]
+
+# Standard units and ranges (temperature in Fahrenheit).
+# Optional keys: 'units' lists the accepted units (default: standard unit
+# only), 'display' formats shown values, 'assumed_max' stands in for a
+# missing max when sizing warning ranges. Add vitals with register_vital.
+# Edits, direct or through update_vital_range, rebuild the compiled
+# profile on its next use.
+VITAL_RANGES = RangeTable({
+    'temperature': {
+        'min': 95, 'max': 102, 
+        'standard_unit': 'F',
+        'units': ('F', 'C', 'K'),
+        'display': '{value}°{unit}',
+        'alert': 'Temperature critical!',
+        'warning_low': 'Warning: Approaching hypothermia',
+        'warning_high': 'Warning: Approaching hyperthermia'
+    },
+    'pulse': {
+        'min': 60, 'max': 100, 
+        'standard_unit': 'bpm',
+        'alert': 'Pulse Rate is out of range!',
+        'warning_low': 'Warning: Approaching low pulse rate',
+        'warning_high': 'Warning: Approaching high pulse rate'
+    },
+    'spo2': {
+        'min': 90, 'max': None, 
+        'standard_unit': '%',
+        'assumed_max': 100,
+        'alert': 'Oxygen Saturation out of range!',
+        'warning_low': 'Warning: Approaching low oxygen saturation',
+        'warning_high': None
+    }, 
+})
+
+WARNING_TOLERANCE_PERCENT = 1.5
+
+# Age bands as (lowest age in years, band name), youngest first
+AGE_BANDS = ((0, 'infant'), (1, 'child'), (12, 'adolescent'), (18, 'adult'))
+
+# Limits of each age band that differ from VITAL_RANGES
+AGE_BAND_LIMITS = RangeTable({
+    'infant': {'pulse': {'min': 100, 'max': 160}},
+    'child': {'pulse': {'min': 70, 'max': 120}},
+    'adolescent': {},
+    'adult': {},
+})
+
+# Trend rules over rolling windows (standard units, rates per minute).
+# A window keeps the samples of the last window_seconds, with room for
+# max_rate readings per second; rules are checked once the window spans
+# min_seconds.
+VITAL_TRENDS = {
+    'temperature': {
+        'window_seconds': 900, 'max_rate': 1, 'min_seconds': 120,
+        'rise_per_minute': 0.3, 'fall_per_minute': 0.3,
+        'near_limit_seconds': 600,
+        'rapid_rise': 'Warning: Temperature rising rapidly',
+        'rapid_fall': 'Warning: Temperature falling rapidly',
+        'sustained_near_limit': 'Warning: Temperature near limit for too long'
+    },
+    'pulse': {
+        'window_seconds': 120, 'max_rate': 4, 'min_seconds': 30,
+        'rise_per_minute': 10, 'fall_per_minute': 10,
+        'near_limit_seconds': 60,
+        'rapid_rise': 'Warning: Pulse Rate rising rapidly',
+        'rapid_fall': 'Warning: Pulse Rate falling rapidly',
+        'sustained_near_limit': 'Warning: Pulse Rate near limit for too long'
+    },
+    'spo2': {
+        'window_seconds': 300, 'max_rate': 4, 'min_seconds': 30,
+        'rise_per_minute': None, 'fall_per_minute': 2,
+        'near_limit_seconds': 120,
+        'rapid_rise': None,
+        'rapid_fall': 'Warning: Oxygen Saturation falling rapidly',
+        'sustained_near_limit':
+            'Warning: Oxygen Saturation near limit for too long'
+    },
+}
+
+# Alert suppression per vital (standard units, seconds). A reading must be
+# hysteresis past an edge to leave a band toward ok, and a new status must
+# hold for dwell_seconds (critical_dwell_seconds when it is critical)
+# before it is reported.
+VITAL_ALERTING = {
+    'temperature': {'hysteresis': 0.2, 'dwell_seconds': 30,
+                    'critical_dwell_seconds': 0},
+    'pulse': {'hysteresis': 2, 'dwell_seconds': 10,
+              'critical_dwell_seconds': 0},
+    'spo2': {'hysteresis': 1, 'dwell_seconds': 15,
+             'critical_dwell_seconds': 0},
+}
+
+# Compiled unit converters and display rules of every vital
+VITALS = VitalRegistry(VITAL_RANGES)
+
+def normalize_temperature(value, unit):
+    """Convert temperature to standard unit (Fahrenheit)."""
+    unit_upper = unit.upper()
+    if unit_upper == 'C':
+        return celsius_to_fahrenheit(value)
+    if unit_upper == 'F':
+        return value
+    raise ValueError(f"Unsupported temperature unit: {unit}. Use 'C' or 'F'.")
+
+def normalize_vital_value(vital_name, value, unit=None):
+    """Convert vital value to standard unit if needed."""
+    if unit is None:
+        return value
+    return VITALS.normalize(vital_name, value, unit)
+
+def _calculate_tolerance(max_val):
+    """Calculate tolerance value based on maximum value."""
+    return max_val * WARNING_TOLERANCE_PERCENT / 100
+
+def _get_warning_range_or_none(min_val, max_val):
+    """Return warning range tuple or None if min_val is None."""
+    return (min_val, max_val) if min_val is not None else None
+
+def _calculate_ranges_with_max(min_val, max_val):
+    """Calculate warning ranges for vitals that have both min and max values."""
+    tolerance = _calculate_tolerance(max_val)
+    warning_low_max = min_val + tolerance if min_val is not None else None
+    warning_high_min = max_val - tolerance
+    return {
+        'warning_low_range': _get_warning_range_or_none(min_val, warning_low_max),
+        'warning_high_range': (warning_high_min, max_val)
+    }
+
+def _calculate_ranges_without_max(vital_name, min_val):
+    """Calculate warning ranges for vitals that only have minimum values (like spo2)."""
+    if min_val is None:
+        return {'warning_low_range': None, 'warning_high_range': None}
+    
+    assumed_max = VITALS.spec(vital_name).assumed_max or min_val * 2
+    tolerance = _calculate_tolerance(assumed_max)
+    warning_low_max = min_val + tolerance
+    return {
+        'warning_low_range': (min_val, warning_low_max),
+        'warning_high_range': None
+    }
+
+def warning_ranges_for_limits(vital_name, min_val, max_val):
+    """Calculate warning ranges of a vital for the given limits."""
+    if max_val is not None:
+        return _calculate_ranges_with_max(min_val, max_val)
+    return _calculate_ranges_without_max(vital_name, min_val)
+
+def calculate_warning_ranges(vital_name):
+    """Calculate warning ranges based on 1.5% tolerance of upper limit."""
+    vital = VITAL_RANGES[vital_name]
+    return warning_ranges_for_limits(vital_name, vital['min'], vital['max'])
+
+# Status codes returned by ThresholdProfile.classify
+STATUS_OK = 0
+STATUS_WARNING_LOW = 1
+STATUS_WARNING_HIGH = 2
+STATUS_CRITICAL = 3
+
+# Status of each band between the four compiled edges, lowest band first
+BAND_STATUS = (STATUS_CRITICAL, STATUS_WARNING_LOW, STATUS_OK,
+               STATUS_WARNING_HIGH, STATUS_CRITICAL)
+STATUS_RESULTS = ('ok', 'warning', 'warning', 'critical')
+WARNING_DIRECTIONS = {STATUS_WARNING_LOW: 'low', STATUS_WARNING_HIGH: 'high'}
+STATUS_MESSAGE_KEYS = {
+    STATUS_WARNING_LOW: 'warning_low',
+    STATUS_WARNING_HIGH: 'warning_high',
+    STATUS_CRITICAL: 'alert',
+}
+
+# Errors raised by malformed readings, unknown vitals or bad units
+READING_ERRORS = (ValueError, KeyError, TypeError, AttributeError)
+
+def _exclusive_edge(limit):
+    """Smallest float above an inclusive limit, for use with bisect_right."""
+    return math.nextafter(limit, math.inf)
+
+def _warning_bands(vital_name, min_val, max_val):
+    """Return low and high warning bands, open-ended where a limit is absent."""
+    ranges = warning_ranges_for_limits(vital_name, min_val, max_val)
+    low = ranges['warning_low_range'] or (-math.inf, -math.inf)
+    high = ranges['warning_high_range'] or (math.inf, math.inf)
+    return low, high
+
+def compile_edges(vital_name, min_val, max_val):
+    """Compile limits of a vital into a tuple of band edges for bisect_right.
+
+    The edges split readings into critical-low, warning-low, ok,
+    warning-high and critical-high bands, matching the inclusive
+    comparisons of calculate_warning_ranges.
+    """
+    bands = _warning_bands(vital_name, min_val, max_val)
+    (low_min, low_max), (high_min, high_max) = bands
+    ok_min = _exclusive_edge(low_max)
+    return (low_min, ok_min, max(high_min, ok_min), _exclusive_edge(high_max))
+
+def compile_vital_edges(vital_name):
+    """Compile the band edges of a vital as configured in VITAL_RANGES."""
+    vital = VITAL_RANGES[vital_name]
+    return compile_edges(vital_name, vital['min'], vital['max'])
+
+class _EdgeTable(dict):
+    """Vital name to compiled edges, compiling each vital on first use."""
+
+    def __missing__(self, vital_name):
+        edges = self[vital_name] = compile_vital_edges(vital_name)
+        return edges
+
+class ThresholdProfile:
+    """Band edges of every vital, compiled from VITAL_RANGES.
+
+    panels caches a PanelPlan per panel schema (the tuple of its vital
+    names), so it is dropped together with the edges it refers to.
+    """
+    __slots__ = ('edges', 'tolerance', 'panels', 'edits')
+
+    def __init__(self, tolerance):
+        self.edges = _EdgeTable()
+        self.tolerance = tolerance
+        self.panels = {}
+        self.edits = RangeTable.edits
+
+    def band(self, vital_name, normalized_value):
+        """Return the band index (0-4) of an already normalized value."""
+        return bisect_right(self.edges[vital_name], normalized_value)
+
+    def classify(self, vital_name, normalized_value):
+        """Return the STATUS_* code of an already normalized value."""
+        return BAND_STATUS[bisect_right(self.edges[vital_name],
+                                        normalized_value)]
+
+# Compiled under no tolerance, so rebuilt on first use
+_threshold_profile = ThresholdProfile(None)
+
+def _rebuild_threshold_profile():
+    global _threshold_profile
+    VITALS.invalidate()
+    _threshold_profile = ThresholdProfile(WARNING_TOLERANCE_PERCENT)
+    return _threshold_profile
+
+def threshold_profile():
+    """Return the compiled profile, rebuilding it if the tolerance,
+    VITAL_RANGES or AGE_BAND_LIMITS changed."""
+    profile = _threshold_profile
+    if (profile.tolerance != WARNING_TOLERANCE_PERCENT
+            or profile.edits != RangeTable.edits):
+        profile = _rebuild_threshold_profile()
+    return profile
+
+def invalidate_threshold_profile():
+    """Drop compiled limits and units. Edits of VITAL_RANGES and
+    AGE_BAND_LIMITS are noticed without this; it is for configuration it cannot see changing."""
+    global _threshold_profile
+    _threshold_profile = ThresholdProfile(None)
+    VITALS.invalidate()
+
+def update_vital_range(vital_name, **fields):
+    """Change the configuration of a vital and invalidate the profile."""
+    VITAL_RANGES.setdefault(vital_name, {}).update(fields)
+    invalidate_threshold_profile()
+
+def register_vital(vital_name, **config):
+    """Add or replace a vital, using the keys of VITAL_RANGES entries.
+
+    Multi-component vitals pass 'components', a dict of component name to
+    its limits and messages; each becomes '<vital_name>.<component>'.
+    """
+    spec = VITALS.register(vital_name, config)
+    invalidate_threshold_profile()
+    return spec
+
+def unregister_vital(vital_name):
+    """Remove a vital registered with register_vital."""
+    VITALS.unregister(vital_name)
+    invalidate_threshold_profile()
+
+def set_warning_tolerance(percent):
+    """Change WARNING_TOLERANCE_PERCENT and invalidate the profile."""
+    global WARNING_TOLERANCE_PERCENT
+    WARNING_TOLERANCE_PERCENT = percent
+    invalidate_threshold_profile()
+
+def classify_vital(vital_name, value, unit=None):
+    """Return the STATUS_* code of a reading without printing anything."""
+    profile = threshold_profile()
+    return profile.classify(vital_name,
+                            normalize_vital_value(vital_name, value, unit))
+
+def is_vital_ok(vital_name, value, unit=None):
+    """Check if vital is within normal range."""
+    return classify_vital(vital_name, value, unit) != STATUS_CRITICAL
+
+def is_in_warning_range(vital_name, value, unit=None):
+    """Check if vital is in warning range."""
+    status = classify_vital(vital_name, value, unit)
+    return WARNING_DIRECTIONS.get(status, False)
+
+def _is_unit_format(vital_data):
+    """Check if vital data is in unit format (dictionary with 'value' key)."""
+    return isinstance(vital_data, dict) and 'value' in vital_data
+
+def extract_vital_data(vital_data):
+    """Extract value and unit from vital data, handling both formats."""
+    if _is_unit_format(vital_data):
+        return vital_data['value'], vital_data.get('unit', None)
+    return vital_data, None
+
+def vital_readings(vital_name, vital_data):
+    """Return (vital, value, unit) readings, one per component if any."""
+    value, unit = extract_vital_data(vital_data)
+    components = VITALS.spec(vital_name).components
+    if components is None:
+        return ((vital_name, value, unit),)
+    return tuple(zip(components, value, repeat(unit, len(components)),
+                     strict=True))
+
+def panel_readings(vitals):
+    """Yield the (vital, value, unit) readings of a vitals panel."""
+    for vital_name, vital_data in vitals.items():
+        yield from vital_readings(vital_name, vital_data)
+
+class PanelPlan:
+    """Vitals of one panel schema, validated once and ready to classify.
+
+    entries holds a (vital name, is composite, ((reading vital, edges),
+    ...)) triple per vital, one reading vital per component, in panel
+    order. order is a tuple of the same entries for verdicts: vitals with
+    fewer readings and fewer accepted units first, and the vital that
+    last failed moved to the front. It is replaced rather than changed,
+    so a verdict in another thread keeps the order it started with.
+    """
+    __slots__ = ('entries', 'order')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.order = tuple(sorted(entries, key=_entry_cost))
+
+    def failed_first(self, entry):
+        """Move entry to the front of the verdict order."""
+        order = self.order
+        index = order.index(entry)
+        if index:
+            self.order = (entry,) + order[:index] + order[index + 1:]
+
+def _entry_cost(entry):
+    """Sort key putting cheap vitals first: fewer readings, fewer units."""
+    vital_name, _, readings = entry
+    return len(readings), len(set(VITALS.spec(vital_name).unit_names.values()))
+
+def _plan_entry(profile, vital_name):
+    """Return the PanelPlan entry of a vital, checking it is configured."""
+    try:
+        components = VITALS.spec(vital_name).components
+    except KeyError:
+        raise ValueError(f"Unknown vital: {vital_name}") from None
+    names = components or (vital_name,)
+    readings = tuple(zip(names, map(profile.edges.__getitem__, names)))
+    return vital_name, components is not None, readings
+
+def panel_plan(vitals):
+    """Return the PanelPlan of the schema of a vitals panel.
+
+    Raises ValueError for a vital that is not configured; the check runs
+    once per schema, after which the plan is served from the profile.
+    """
+    profile = threshold_profile()
+    schema = tuple(vitals)
+    plan = profile.panels.get(schema)
+    if plan is None:
+        plan = PanelPlan(tuple(_plan_entry(profile, vital_name)
+                               for vital_name in schema))
+        profile.panels[schema] = plan
+    return plan
+
+def _entry_values(entry, vital_data):
+    """Return (values, unit) of one vital of a panel, a value per reading."""
+    value, unit = extract_vital_data(vital_data)
+    return (value if entry[1] else (value,)), unit
+
+def _entry_statuses(entry, vital_data):
+    """Yield (reading vital, STATUS_* code) for one vital of a panel."""
+    values, unit = _entry_values(entry, vital_data)
+    for (vital_name, edges), value in zip(entry[2], values, strict=True):
+        normalized_value = normalize_vital_value(vital_name, value, unit)
+        yield vital_name, BAND_STATUS[bisect_right(edges, normalized_value)]
+
+def _entry_critical(entry, vital_data):
+    """Return True if a reading of one vital of a panel is critical."""
+    values, unit = _entry_values(entry, vital_data)
+    for (vital_name, (low, _, _, high)), value in zip(entry[2], values,
+                                                      strict=True):
+        if not low <= normalize_vital_value(vital_name, value, unit) < high:
+            return True
+    return False
+
+def panel_verdict(vitals):
+    """Return True unless a vital of the panel is critical.
+
+    Stops at the first critical reading and never formats or prints.
+    """
+    plan = panel_plan(vitals)
+    for entry in plan.order:
+        if _entry_critical(entry, vitals[entry[0]]):
+            plan.failed_first(entry)
+            return False
+    return True
+
+class PanelReport:
+    """Status of every reading of a panel, keyed by (component) vital."""
+    __slots__ = ('statuses', 'ok')
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.ok = STATUS_CRITICAL not in statuses.values()
+
+    def with_status(self, *statuses):
+        """Return the vitals whose status is one of statuses."""
+        return tuple(vital_name for vital_name, status
+                     in self.statuses.items() if status in statuses)
+
+    def failed(self):
+        """Return the critical vitals."""
+        return self.with_status(STATUS_CRITICAL)
+
+    def warnings(self):
+        """Return the vitals in a warning range."""
+        return self.with_status(STATUS_WARNING_LOW, STATUS_WARNING_HIGH)
+
+def panel_report(vitals):
+    """Classify every reading of a panel in one pass, without printing."""
+    statuses = {}
+    for entry in panel_plan(vitals).entries:
+        statuses.update(_entry_statuses(entry, vitals[entry[0]]))
+    return PanelReport(statuses)
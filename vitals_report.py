@@ -0,0 +1,57 @@
+"""Displayed warnings and alerts, and the checks that report them.
+
+monitor loads this module on first use of one of its names, so that
+processes that only classify never import the alert dispatcher.
+"""
+from alert_dispatch import default_dispatcher
+from vitals_core import (STATUS_CRITICAL, STATUS_MESSAGE_KEYS, STATUS_RESULTS,
+                         VITAL_RANGES, VITALS, classify_vital, panel_readings)
+
+def warning_message(message):
+    """Display warning message."""
+    print(f"⚠️  {message}")
+
+def alert_message(message):
+    """Queue alert for background display so the caller never blocks."""
+    default_dispatcher().submit(message)
+
+def _format_display_value(value, vital_name, unit):
+    """Format the display value with appropriate unit."""
+    spec = VITALS.spec(vital_name)
+    if spec.display and unit:
+        return spec.display.format(value=value,
+                                   unit=spec.unit_names.get(unit, unit))
+    return str(value)
+
+def report_status(status, vital_name, value, unit):
+    """Display the warning or alert for a status; ok prints nothing."""
+    message_key = STATUS_MESSAGE_KEYS.get(status)
+    if message_key is None:
+        return
+    display_value = _format_display_value(value, vital_name, unit)
+    output = alert_message if status == STATUS_CRITICAL else warning_message
+    output(f"{VITAL_RANGES[vital_name][message_key]} (Value: {display_value})")
+
+def check_vital_with_warning(vital_name, value, unit=None):
+    """Check vital and display appropriate warning or alert."""
+    status = classify_vital(vital_name, value, unit)
+    report_status(status, vital_name, value, unit)
+    return STATUS_RESULTS[status]
+
+def check_vital(vital_name, value, unit=None):
+    result = check_vital_with_warning(vital_name, value, unit)
+    return result == 'ok' or result == 'warning'
+
+def vitals_ok(vitals):
+    """Check all vitals and return True if all are OK or just warnings.
+    
+    vitals can be:
+    - Simple format: {'temperature': 98.6, 'pulse': 70, 'spo2': 95}
+    - With units: {'temperature': {'value': 37, 'unit': 'C'}, 'pulse': 70, 'spo2': 95}
+    - Multi-component: {'blood_pressure': {'value': (120, 80), 'unit': 'mmHg'}}
+
+    Displays a warning or alert per reading up to the first critical
+    one. panel_verdict gives the same answer without displaying
+    anything and panel_report classifies every reading.
+    """
+    return all(check_vital(*reading) for reading in panel_readings(vitals))